@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# mimk benchmark
+#
+# Generates a synthetic C project and measures mimk's own overhead, using a stub compiler
+# Scenarios: clean build, no-op build, one header touched, all files touched without changes, remove (-r)
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Path of mimk script next to this folder
+mimk_default = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'mimk.py')
+
+# Scenarios in order of execution
+scenarios = ['clean', 'noop', 'touch', 'rehash', 'remove']
+
+# Stub compiler: writes dependency, object and target files without doing any real work
+stub_compiler = r'''import hashlib, os, re, sys
+
+include_re = re.compile(r'^#include "(.+)"', re.M)
+
+# Get source file and all included headers (recursively)
+def includes(path):
+    files = [path]
+    for file in files:
+        with open(file) as f:
+            for inc in include_re.findall(f.read()):
+                inc = os.path.join('inc', inc)
+                if inc not in files:
+                    files.append(inc)
+    return files
+
+cmd = sys.argv[1]
+if cmd == 'dep':
+    # dep DEP_PATH SRC_PATH
+    obj = os.path.splitext(os.path.basename(sys.argv[3]))[0] + '.o'
+    with open(sys.argv[2], 'w') as f:
+        f.write(obj + ': ' + ' \\\n '.join(includes(sys.argv[3])) + '\n')
+elif cmd == 'cc':
+    # cc SRC_PATH OBJ_PATH
+    h = hashlib.sha256()
+    for file in includes(sys.argv[2]):
+        with open(file, 'rb') as f:
+            h.update(f.read())
+    with open(sys.argv[3], 'w') as f:
+        f.write(h.hexdigest() + '\n')
+elif cmd == 'ld':
+    # ld TARGET_PATH OBJ...
+    with open(sys.argv[2], 'w') as out:
+        for file in sys.argv[3:]:
+            with open(file) as f:
+                out.write(f.read())
+'''
+
+# Wrapper running mimk in-process, so that its own I/O counters can be read on exit
+mimk_wrapper = r'''import atexit, json, resource, runpy, sys
+io_path, mimk = sys.argv[1], sys.argv[2]
+def dump_io():
+    try:
+        with open('/proc/self/io') as f:
+            io = dict(line.split(': ') for line in f.read().splitlines())
+        io = {k: int(v) for k, v in io.items()}
+        # CPU time of mimk process (all threads), excluding commands
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        io['cpu'] = usage.ru_utime + usage.ru_stime
+        with open(io_path, 'w') as f:
+            json.dump(io, f)
+    except OSError:
+        pass
+atexit.register(dump_io)
+sys.argv = sys.argv[2:]
+runpy.run_path(mimk, run_name='__main__')
+'''
+
+# Comment padding files to the given size, e.g. to model large generated sources
+def padding(args):
+    if args.file_size <= 0:
+        return ''
+    line = '/* ' + 'x' * 60 + ' */\n'
+    return line * (args.file_size * 1024 // len(line))
+
+# Generate synthetic project
+def generate(root, args):
+    rnd = random.Random(args.seed)
+    os.makedirs(os.path.join(root, 'cfg'))
+    os.makedirs(os.path.join(root, 'inc'))
+    os.makedirs(os.path.join(root, 'tools'))
+
+    # Headers, each including some of the later headers (fan-out), so there are no cycles
+    headers = ['h{}.h'.format(i) for i in range(args.headers)]
+    for i, header in enumerate(headers):
+        later = headers[i + 1:]
+        nested = rnd.sample(later, min(args.fan_out, len(later)))
+        with open(os.path.join(root, 'inc', header), 'w') as f:
+            f.write(''.join('#include "{}"\n'.format(h) for h in nested))
+            f.write('int h{}_value(void);\n'.format(i))
+            f.write(padding(args))
+
+    # Sources, each including some of the headers (fan-in) and spread over the targets
+    targets = []
+    for t in range(args.targets):
+        src_dir = os.path.join('src', 't{}'.format(t))
+        os.makedirs(os.path.join(root, src_dir))
+        count = args.sources // args.targets + (1 if t < args.sources % args.targets else 0)
+        for s in range(count):
+            with open(os.path.join(root, src_dir, 's{}.c'.format(s)), 'w') as f:
+                f.write(''.join('#include "{}"\n'.format(h) for h in rnd.sample(headers, min(args.fan_in, len(headers)))))
+                f.write('int t{}_s{}(void) {{ return {}; }}\n'.format(t, s, s))
+                f.write(padding(args))
+        target = {
+            'TARGET':   't{}'.format(t),
+            'SRCDIR':   src_dir,
+            'DEPRULE':  '$STUB dep $DEP_PATH $SRC_PATH',
+            'SRCRULE':  '$STUB cc $SRC_PATH $OBJ_PATH',
+            'OBJRULE':  '$STUB ld $TARGET_PATH $OBJ_LIST'
+        }
+        # DEPENDS chains: each target depends on the previous one within its chain
+        if args.chain > 1 and t % args.chain:
+            target['DEPENDS'] = 'build/bench/t{}'.format(t - 1)
+        targets.append(target)
+
+    with open(os.path.join(root, 'tools', 'stub.py'), 'w') as f:
+        f.write(stub_compiler)
+    with open(os.path.join(root, 'cfg', 'bench.py'), 'w') as f:
+        f.write('config = ' + repr({
+            'BUILD':    'bench',
+            'STUB':     '{} -S {}'.format(sys.executable, os.path.join('tools', 'stub.py')),
+            'DEPPATH':  'dep',
+            'OBJPATH':  'obj'
+        }) + '\n')
+    with open(os.path.join(root, 'cfg', 'project.py'), 'w') as f:
+        f.write('targets = ' + repr(targets) + '\n')
+    return headers
+
+# Run mimk once, return measurements
+def run_mimk(root, mimk, mimk_args):
+    io_path = os.path.join(root, '.io.json')
+    if os.path.exists(io_path):
+        os.remove(io_path)
+    command = [sys.executable, '-c', mimk_wrapper, io_path, mimk, '-q', '-c', 'bench'] + mimk_args + ['project']
+    with tempfile.TemporaryFile() as error_file:
+        time_start = time.perf_counter()
+        proc = subprocess.Popen(command, cwd=root, stdout=subprocess.DEVNULL, stderr=error_file)
+        _, status, rusage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - time_start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        error_file.seek(0)
+        error = error_file.read().decode(errors='replace')
+    result = {
+        'wall': wall,
+        # Peak RSS of the largest process (mimk itself, since the stub compiler is smaller)
+        'maxrss_kb': rusage.ru_maxrss,
+        'returncode': proc.returncode
+    }
+    try:
+        with open(io_path) as f:
+            io = json.load(f)
+        # Counters of mimk process only, excluding compiler processes
+        result.update({'syscr': io['syscr'], 'syscw': io['syscw'], 'rchar': io['rchar'], 'wchar': io['wchar'], 'cpu': io['cpu']})
+    except (OSError, ValueError, KeyError):
+        pass
+    if proc.returncode:
+        result['error'] = error[-2000:]
+    return result
+
+# Run all scenarios on a freshly generated project
+def run_scenarios(root, headers, args):
+    rnd = random.Random(args.seed)
+    results = {}
+    mimk_args = ['-t', str(args.threads), '-e', args.executor]
+    if args.database:
+        with open(os.path.join(root, 'cfg', 'bench.py'), 'a') as f:
+            f.write('config[\'DATABASE\'] = {!r}\n'.format(args.database))
+    if args.digest:
+        with open(os.path.join(root, 'cfg', 'bench.py'), 'a') as f:
+            f.write('config[\'DIGEST\'] = {!r}\n'.format(args.digest))
+    for scenario in scenarios:
+        if scenario == 'clean':
+            shutil.rmtree(os.path.join(root, 'build'), ignore_errors=True)
+            results[scenario] = run_mimk(root, args.mimk, mimk_args)
+        elif scenario == 'noop':
+            results[scenario] = run_mimk(root, args.mimk, mimk_args)
+        elif scenario == 'touch':
+            # Change content of one header, so that all sources including it are rebuilt
+            header = os.path.join(root, 'inc', rnd.choice(headers)) if headers else None
+            if header:
+                with open(header, 'a') as f:
+                    f.write('/* touched */\n')
+            results[scenario] = run_mimk(root, args.mimk, mimk_args)
+        elif scenario == 'rehash':
+            # Update modification time of all source and header files without changing them (e.g. after switching branches),
+            # so that all of them are hashed again, but nothing is rebuilt
+            for folder in ['src', 'inc']:
+                for path, _, files in os.walk(os.path.join(root, folder)):
+                    for file in files:
+                        os.utime(os.path.join(path, file))
+            results[scenario] = run_mimk(root, args.mimk, mimk_args)
+        elif scenario == 'remove':
+            results[scenario] = run_mimk(root, args.mimk, ['-r'])
+    return results
+
+# Get mimk version from script
+def mimk_version(mimk):
+    try:
+        with open(mimk) as f:
+            match = re.search(r"mimk_version = '(.+)'", f.read())
+        return match.group(1) if match else ''
+    except OSError:
+        return ''
+
+# Summarize repeated runs: minimum and median of each measurement
+def summarize(runs):
+    summary = {}
+    for key in runs[0]:
+        values = [run[key] for run in runs if isinstance(run.get(key), (int, float))]
+        if values and key != 'returncode':
+            summary[key] = {'min': min(values), 'median': statistics.median(values)}
+    return summary
+
+# Get median CPU time of mimk process from summary
+def cpu_str(summary):
+    return '{:.3f}s'.format(summary['cpu']['median']) if 'cpu' in summary else '-'
+
+# Compare two result files
+def compare(old_file, new_file):
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    print('{:<10} {:>12} {:>12} {:>8} {:>12} {:>12} {:>12} {:>12}'.format('Scenario', 'Old wall', 'New wall', 'Ratio', 'Old CPU', 'New CPU', 'Old syscr', 'New syscr'))
+    for scenario in scenarios:
+        if scenario in old['summary'] and scenario in new['summary']:
+            o = old['summary'][scenario]
+            n = new['summary'][scenario]
+            print('{:<10} {:>11.3f}s {:>11.3f}s {:>8.2f} {:>12} {:>12} {:>12} {:>12}'.format(scenario, o['wall']['median'], n['wall']['median'],
+                n['wall']['median'] / o['wall']['median'], cpu_str(o), cpu_str(n), o.get('syscr', {}).get('median', '-'), n.get('syscr', {}).get('median', '-')))
+
+# Argument parsing
+parser = argparse.ArgumentParser(description='mimk benchmark with a synthetic C project')
+parser.add_argument('-m', '--mimk', default=mimk_default, help='mimk script to benchmark')
+parser.add_argument('-n', '--sources', type=int, default=1000, help='Number of source files')
+parser.add_argument('-i', '--headers', type=int, default=200, help='Number of header files')
+parser.add_argument('--fan-in', type=int, default=10, help='Number of headers included by each source file')
+parser.add_argument('--fan-out', type=int, default=3, help='Number of headers included by each header file')
+parser.add_argument('-g', '--targets', type=int, default=4, help='Number of targets')
+parser.add_argument('--chain', type=int, default=1, help='Length of DEPENDS chains between targets (1: independent targets)')
+parser.add_argument('-t', '--threads', type=int, default=0, help='Number of threads passed to mimk')
+parser.add_argument('-e', '--executor', choices=['thread', 'process', 'jobserver'], default='thread', help='Executor passed to mimk')
+parser.add_argument('--database', choices=['sqlite', 'json'], help='Build database passed to mimk (DATABASE)')
+parser.add_argument('--digest', help='Hash digest passed to mimk (DIGEST)')
+parser.add_argument('--file-size', type=int, default=0, metavar='KB', help='Pad source and header files to this size in KB')
+parser.add_argument('-k', '--repeat', type=int, default=1, help='Number of repetitions of all scenarios')
+parser.add_argument('-s', '--seed', type=int, default=1, help='Random seed of generated project')
+parser.add_argument('-d', '--dir', help='Folder of generated project (default: temporary folder, removed afterwards)')
+parser.add_argument('-o', '--output', default='bench_results.json', help='Results file')
+parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two results files and exit')
+args = parser.parse_args()
+
+if args.compare:
+    compare(*args.compare)
+    sys.exit(0)
+
+args.mimk = os.path.abspath(args.mimk)
+args.targets = max(1, args.targets)
+runs = {scenario: [] for scenario in scenarios}
+for repeat in range(args.repeat):
+    root = args.dir or tempfile.mkdtemp(prefix='mimk_bench_')
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    headers = generate(root, args)
+    results = run_scenarios(root, headers, args)
+    for scenario in scenarios:
+        runs[scenario].append(results[scenario])
+        print('{:<8} {:8.3f}s  {:8.3f}s CPU  {:8} kB  {:>8} reads{}'.format(scenario, results[scenario]['wall'], results[scenario].get('cpu', 0),
+            results[scenario]['maxrss_kb'], results[scenario].get('syscr', '-'), '  FAILED ({})'.format(results[scenario]['returncode']) if results[scenario]['returncode'] else ''))
+    if not args.dir:
+        shutil.rmtree(root)
+
+# Write results
+output = {
+    'mimk': args.mimk,
+    'version': mimk_version(args.mimk),
+    'python': sys.version.split(' ')[0],
+    'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+    'params': {k: v for k, v in vars(args).items() if k not in ('mimk', 'output', 'compare', 'dir')},
+    'runs': runs,
+    'summary': {scenario: summarize(runs[scenario]) for scenario in scenarios}
+}
+with open(args.output, 'w') as f:
+    json.dump(output, f, indent=2)
+print('Results written to {}'.format(args.output))
@@ -1,27 +1,66 @@
 #!/usr/bin/env python
 import argparse
+import ast
+import atexit
 import concurrent.futures
+import contextlib
+import ctypes
+import ctypes.util
 import datetime
+import errno
 import glob
 import hashlib
+import heapq
 import importlib
+import itertools
 import json
+import math
+import multiprocessing
 import os
+import select
+import selectors
 import shlex
 import shutil
+import signal
+import socket
+import sqlite3
+import statistics
 import string
+import struct
 import subprocess
 import sys
 import threading
+import time
+import urllib.request
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Linux ioctl to clone a file (reflink)
+FICLONE = 0x40049409
 
 # Version and date
 mimk_version = '1.43'
 mimk_date = '2025-12-19'
 
+# Error in configuration or usage, raised to users of the Python API and reported by the command line interface
+class MimkError(Exception):
+    pass
+
 # Terminal detection
 def is_terminal():
     return hasattr(sys.stdout, 'isatty') and sys.stdout.isatty()
 
+# Output and error output of current job, printed at once when the job has finished (no list: print directly),
+# and peak memory (MB) of the job's external commands
+job_output = threading.local()
+print_lock = threading.Lock()
+
 # Color printing
 def color_print(str, col='red', pre=''):
     color = {
@@ -38,7 +77,22 @@ def color_print(str, col='red', pre=''):
     if not is_terminal():
         col = 'none'
         reset = 'none'
-    print(pre + color[col] + str + color[reset])
+    lines = getattr(job_output, 'lines', None)
+    if lines is not None:
+        lines.append(pre + color[col] + str + color[reset])
+    else:
+        print(pre + color[col] + str + color[reset])
+
+# Print captured output and error output of job
+def flush_output(lines, errors=None):
+    if lines or errors:
+        with print_lock:
+            if lines:
+                sys.stdout.write('\n'.join(lines) + '\n')
+                sys.stdout.flush()
+            if errors:
+                sys.stderr.write('\n'.join(errors) + '\n')
+                sys.stderr.flush()
 
 # Remove duplicates from list
 def unique_list(list):
@@ -46,18 +100,593 @@ def unique_list(list):
     seen_add = seen.add
     return [x for x in list if not (x in seen or seen_add(x))]
 
-# Get SHA-256 hash of file
-def sha256file(filename, ext=''):
-    hash_sha256 = hashlib.sha256()
+# Trace events in Chrome trace-event format, recorded as complete ('X') events, only if tracing is enabled ('--trace')
+trace_enabled = False
+trace_events = []
+trace_threads = {}
+trace_lock = threading.Lock()
+trace_start_ns = time.perf_counter_ns()
+
+# Record a trace span around a block of code
+@contextlib.contextmanager
+def trace(name, cat='mimk', **info):
+    if not trace_enabled:
+        yield
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        end = time.perf_counter_ns()
+        tid = threading.get_ident()
+        event = {
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': (start - trace_start_ns) / 1000,
+            'dur': (end - start) / 1000,
+            'pid': os.getpid(),
+            'tid': tid,
+            'args': {k: v for k, v in info.items() if v}
+        }
+        with trace_lock:
+            trace_events.append(event)
+            trace_threads.setdefault(tid, threading.current_thread().name)
+
+# Enable tracing, writing trace events to a JSON file on exit, including failed builds
+def start_trace(filename):
+    global trace_enabled
+    trace_enabled = True
+    atexit.register(write_trace, filename)
+
+# Write trace events to a JSON file viewable in Perfetto or chrome://tracing
+def write_trace(filename):
+    with trace_lock:
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'args': {'name': name}} for tid, name in trace_threads.items()]
+        events += trace_events
+    with open(filename, 'w') as trace_file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+
+# Size of read buffer when hashing files: hashing large blocks releases the GIL, so that threads hash files in parallel
+hash_buffer_size = 1 << 20
+
+# Read buffer of each thread
+hash_buffer = threading.local()
+
+# Get hash of file with given hashlib digest (e.g. 'sha256' or 'blake2b'), or -1 if file cannot be read
+# File is read unbuffered into a reused buffer, i.e. without copying it into a new bytes object for each block
+def digest_file(filename, digest='sha256', ext=''):
+    file_hash = hashlib.new(digest)
     if not os.path.isfile(filename):
         filename += ext
+    view = getattr(hash_buffer, 'view', None)
+    if view is None:
+        view = hash_buffer.view = memoryview(bytearray(hash_buffer_size))
     try:
-        with open(filename, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b''):
-                hash_sha256.update(chunk)
+        with open(filename, 'rb', buffering=0) as f:
+            while True:
+                size = f.readinto(view)
+                if not size:
+                    break
+                file_hash.update(view[:size])
     except EnvironmentError:
         return -1
-    return hash_sha256.hexdigest()
+    return file_hash.hexdigest()
+
+# Get hashes of several files (e.g. in a worker process)
+def digest_files(filenames, digest='sha256'):
+    return [digest_file(filename, digest) for filename in filenames]
+
+# Get digest for hashing files: 'DIGEST' key of compiler configuration, any fixed-size hashlib digest
+def file_digest_name(config):
+    digest = config.get('DIGEST', 'sha256')
+    if digest not in hashlib.algorithms_guaranteed or digest.startswith('shake_'):
+        raise MimkError('Unknown digest {} (choose from {})'.format(digest, ', '.join(sorted(d for d in hashlib.algorithms_guaranteed if not d.startswith('shake_')))))
+    return digest
+
+# Get file stat as [size, mtime_ns, inode], or None if file does not exist
+def file_stat(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+# Get stat to be stored: if racily clean, i.e. file may still change within mtime granularity, force re-check next time
+def stored_stat(stat, run_start_ns):
+    if stat[1] >= run_start_ns - racy_ns:
+        return [stat[0], 0, stat[2]]
+    return stat
+
+# Get file entry [size, mtime_ns, inode, hash], or None if file does not exist
+# Like git's index, the file is only re-hashed if its stat differs from the known entry
+def stat_hash_file(filename, ext='', known=None, run_start_ns=0, hash_func=None):
+    if not os.path.isfile(filename):
+        filename += ext
+    stat = file_stat(filename)
+    if not stat:
+        return None
+    if isinstance(known, list) and known[:3] == stat:
+        return known
+    hash = hash_func(filename, stat[0]) if hash_func else digest_file(filename)
+    if hash == -1:
+        return None
+    return stored_stat(stat, run_start_ns) + [hash]
+
+# Get hash from hash dictionary entry (entries without stat are plain hashes)
+def stored_hash(entry):
+    return entry[3] if isinstance(entry, list) else entry
+
+# Files modified within this time before the start of a build are racily clean
+racy_ns = 2000000000
+
+# Build database stored as JSON file (legacy format, holds hashes only)
+class JsonStore:
+    def __init__(self, path, digest='sha256'):
+        self.path = path
+        self.digest = digest
+        self.hashes = {}
+        self.deps = {}
+        self.durations = {}
+        self.memory = {}
+        self.manifests = {}
+        self.commands = {}
+        self.objects = {}
+        try:
+            with open(path, 'r') as f:
+                self.hashes = json.load(f)
+        except Exception:
+            pass
+        # Hashes of another digest are dropped (files without digest entry were hashed with SHA-256)
+        if self.hashes.pop('.digest', 'sha256') != digest:
+            self.hashes = {}
+
+    # Apply changed entries and write the whole file atomically
+    def update(self, hashes={}, deps={}, removed=(), durations={}, manifests={}, commands={}, objects={}, memory={}):
+        self.hashes.update(hashes)
+        self.durations.update(durations)
+        self.memory.update(memory)
+        self.manifests.update(manifests)
+        self.commands.update(commands)
+        self.objects.update(objects)
+        for path in removed:
+            self.hashes.pop(path, None)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(self.hashes, **{'.digest': self.digest}), f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    # Get object files depending on changed files, as dictionary of object file: [target, changed files]
+    def affected(self, files):
+        result = {}
+        for obj, (target, deps) in self.objects.items():
+            changed = [dep for dep in deps if dep in files]
+            if changed:
+                result[obj] = [target, changed]
+        return result
+
+    # Get object files recorded for target
+    def target_objects(self, target):
+        return [obj for obj, entry in self.objects.items() if entry[0] == target]
+
+    # Remove entries of target's files (except durations) and target's manifest
+    def forget(self, target, paths):
+        for path in paths:
+            for entries in [self.hashes, self.deps, self.commands, self.objects]:
+                entries.pop(path, None)
+        self.manifests.pop(target, None)
+        self.update()
+
+    def close(self):
+        pass
+
+# Build database stored in SQLite, only changed entries are written
+class SqliteStore:
+    schema_version = 2
+
+    # A read-only store (dry run) works on an in-memory copy of the database, so that nothing is written
+    def __init__(self, path, digest='sha256', readonly=False):
+        self.path = path
+        if readonly:
+            self.conn = sqlite3.connect(':memory:')
+            if os.path.isfile(path):
+                source = sqlite3.connect('file:{}?mode=ro'.format(urllib.request.pathname2url(os.path.abspath(path))), uri=True)
+                source.backup(self.conn)
+                source.close()
+        else:
+            self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+            if version != self.schema_version:
+                self.conn.execute('DROP TABLE IF EXISTS hashes')
+                self.conn.execute('DROP TABLE IF EXISTS deps')
+            self.conn.execute('PRAGMA user_version={}'.format(self.schema_version))
+            self.conn.execute('CREATE TABLE IF NOT EXISTS hashes (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, hash TEXT)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS deps (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, deps TEXT)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS durations (name TEXT PRIMARY KEY, seconds REAL)')
+            # Peak memory (MB) of jobs, by rule and path like durations
+            self.conn.execute('CREATE TABLE IF NOT EXISTS memory (name TEXT PRIMARY KEY, megabytes REAL)')
+            self.conn.execute("DELETE FROM durations WHERE name LIKE 'MEMORY %'")
+            self.conn.execute('CREATE TABLE IF NOT EXISTS manifests (name TEXT PRIMARY KEY, key TEXT, digest TEXT, files TEXT)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS commands (path TEXT PRIMARY KEY, command TEXT)')
+            # Reverse dependency index: object files depending on each file, and target of each object file
+            self.conn.execute('CREATE TABLE IF NOT EXISTS objects (path TEXT PRIMARY KEY, target TEXT)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS rdeps (file TEXT, object TEXT)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS rdeps_file ON rdeps (file)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS rdeps_object ON rdeps (object)')
+            # Digest of file hashes: when changed, all hashes and manifests are dropped (databases without it used SHA-256)
+            self.conn.execute('CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)')
+            row = self.conn.execute('SELECT value FROM settings WHERE name = ?', ['digest']).fetchone()
+            if (row[0] if row else 'sha256') != digest:
+                self.conn.execute('DELETE FROM hashes')
+                self.conn.execute('DELETE FROM manifests')
+            self.conn.execute('INSERT OR REPLACE INTO settings VALUES (?, ?)', ['digest', digest])
+        self.hashes = {}
+        for path, size, mtime_ns, inode, hash in self.conn.execute('SELECT * FROM hashes'):
+            # Entries without stat (e.g. migrated from JSON) are plain hashes
+            self.hashes[path] = hash if size is None else [size, mtime_ns, inode, hash]
+        self.deps = {}
+        for path, size, mtime_ns, inode, deps in self.conn.execute('SELECT * FROM deps'):
+            self.deps[path] = [size, mtime_ns, inode, json.loads(deps)]
+        self.durations = dict(self.conn.execute('SELECT * FROM durations'))
+        self.memory = dict(self.conn.execute('SELECT * FROM memory'))
+        self.manifests = {}
+        for name, key, digest, files in self.conn.execute('SELECT * FROM manifests'):
+            self.manifests[name] = [key, digest, json.loads(files)]
+        self.commands = dict(self.conn.execute('SELECT * FROM commands'))
+
+    # Apply changed entries, upserting them in one transaction
+    # Reverse dependency index is not loaded, but queried by affected()
+    def update(self, hashes={}, deps={}, removed=(), durations={}, manifests={}, commands={}, objects={}, memory={}):
+        self.hashes.update(hashes)
+        self.deps.update(deps)
+        self.durations.update(durations)
+        self.memory.update(memory)
+        self.manifests.update(manifests)
+        self.commands.update(commands)
+        for path in removed:
+            self.hashes.pop(path, None)
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)',
+                [[path] + (entry if isinstance(entry, list) else [None, None, None, entry]) for path, entry in hashes.items()])
+            self.conn.executemany('INSERT OR REPLACE INTO deps VALUES (?, ?, ?, ?, ?)',
+                [[path] + entry[:3] + [json.dumps(entry[3])] for path, entry in deps.items()])
+            self.conn.executemany('DELETE FROM hashes WHERE path = ?', [[path] for path in removed])
+            self.conn.executemany('INSERT OR REPLACE INTO durations VALUES (?, ?)', durations.items())
+            self.conn.executemany('INSERT OR REPLACE INTO memory VALUES (?, ?)', memory.items())
+            self.conn.executemany('INSERT OR REPLACE INTO manifests VALUES (?, ?, ?, ?)',
+                [[name, manifest[0], manifest[1], json.dumps(manifest[2])] for name, manifest in manifests.items()])
+            self.conn.executemany('INSERT OR REPLACE INTO commands VALUES (?, ?)', commands.items())
+            self.conn.executemany('INSERT OR REPLACE INTO objects VALUES (?, ?)', [[obj, entry[0]] for obj, entry in objects.items()])
+            self.conn.executemany('DELETE FROM rdeps WHERE object = ?', [[obj] for obj in objects])
+            self.conn.executemany('INSERT INTO rdeps VALUES (?, ?)', [[dep, obj] for obj, entry in objects.items() for dep in entry[1]])
+
+    # Get object files depending on changed files, as dictionary of object file: [target, changed files]
+    def affected(self, files):
+        result = {}
+        files = list(files)
+        # Stay below SQLite's limit of host parameters
+        for i in range(0, len(files), 500):
+            chunk = files[i:i + 500]
+            for file, obj, target in self.conn.execute('SELECT rdeps.file, rdeps.object, objects.target FROM rdeps JOIN objects ON objects.path = rdeps.object '
+                    'WHERE rdeps.file IN ({})'.format(', '.join('?' * len(chunk))), chunk):
+                result.setdefault(obj, [target, []])[1].append(file)
+        return result
+
+    # Get object files recorded for target
+    def target_objects(self, target):
+        return [obj for obj, in self.conn.execute('SELECT path FROM objects WHERE target = ?', [target])]
+
+    # Remove entries of target's files (except durations) and target's manifest, in one transaction
+    def forget(self, target, paths):
+        for path in paths:
+            for entries in [self.hashes, self.deps, self.commands]:
+                entries.pop(path, None)
+        self.manifests.pop(target, None)
+        rows = [[path] for path in paths]
+        with self.conn:
+            for table in ['hashes', 'deps', 'commands', 'objects']:
+                self.conn.executemany('DELETE FROM {} WHERE path = ?'.format(table), rows)
+            self.conn.executemany('DELETE FROM rdeps WHERE object = ?', rows)
+            self.conn.execute('DELETE FROM manifests WHERE name = ?', [target])
+
+    def close(self):
+        self.conn.close()
+
+# Open build database, migrating a legacy JSON hash file into a new SQLite database
+# A read-only build database (dry run) is never written, nor is the legacy file removed
+def open_store(kind, build_dir, digest='sha256', readonly=False):
+    json_path = os.path.join(build_dir, '.hashes.json')
+    if kind == 'json':
+        return JsonStore(json_path, digest)
+    elif kind != 'sqlite':
+        raise MimkError('Unknown build database type {}'.format(kind))
+    store = SqliteStore(os.path.join(build_dir, '.mimk.db'), digest, readonly)
+    if os.path.isfile(json_path):
+        store.update(JsonStore(json_path, digest).hashes)
+        if not readonly:
+            os.remove(json_path)
+    return store
+
+# Shared content-addressed object file cache, keyed by compile command, compiler and dependencies' hashes
+class ObjectCache:
+    def __init__(self, cache_dir, max_size, salt=''):
+        self.dir = cache_dir
+        self.max_size = max_size
+        self.salt = salt
+        self.compilers = {}
+        self.hits = 0
+        self.misses = 0
+        self.used = {}
+        self.lock = threading.Lock()
+        makedir(cache_dir)
+        # Index for LRU eviction and statistics, shared by all mimk processes using this cache
+        self.conn = sqlite3.connect(os.path.join(cache_dir, 'cache.db'), timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS objects (key TEXT PRIMARY KEY, size INTEGER, atime REAL)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)')
+
+    # Get identity of compiler (first word of command): resolved path, size and modification time of its executable,
+    # so that objects of another version of the compiler (e.g. after an upgrade) are not used
+    def compiler(self, command):
+        words = command.split(None, 1)
+        name = words[0] if words else ''
+        with self.lock:
+            if name not in self.compilers:
+                path = shutil.which(name)
+                stat = os.stat(path) if path else None
+                self.compilers[name] = '{} {} {}'.format(os.path.realpath(path), stat.st_size, stat.st_mtime_ns) if path else name
+            return self.compilers[name]
+
+    # Get key from salt ('CACHESALT'), compiler, compile command (with output paths masked) and dependencies' hashes,
+    # or None if a dependency is missing
+    def key(self, command, dependencies, hash_file):
+        key_sha256 = hashlib.sha256('{}\0{}\0{}'.format(self.salt, self.compiler(command), command).encode())
+        for dep in dependencies:
+            hash = hash_file(dep)
+            if hash == -1:
+                return None
+            key_sha256.update('\0{}\0{}'.format(dep, hash).encode())
+        return key_sha256.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.dir, key[:2], key[2:])
+
+    # Restore cached object file, return True on hit
+    def restore(self, key, obj_path):
+        path = self.path(key)
+        hit = False
+        if os.path.isfile(path):
+            try:
+                if os.path.lexists(obj_path):
+                    os.remove(obj_path)
+                clone_file(path, obj_path)
+                hit = True
+            except OSError:
+                pass
+        with self.lock:
+            if hit:
+                self.hits += 1
+                self.used[key] = os.path.getsize(path)
+            else:
+                self.misses += 1
+        return hit
+
+    # Add compiled object file to cache
+    def insert(self, key, obj_path):
+        path = self.path(key)
+        tmp_path = '{}.{}.{}'.format(path, os.getpid(), threading.get_ident())
+        try:
+            makedir(os.path.dirname(path))
+            clone_file(obj_path, tmp_path)
+            os.replace(tmp_path, path)
+            with self.lock:
+                self.used[key] = os.path.getsize(path)
+        except OSError:
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+
+    # Write used entries and statistics, and evict least recently used entries until cache fits its maximum size
+    def close(self):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO objects VALUES (?, ?, ?)', [[key, size, now] for key, size in self.used.items()])
+            for name, value in [['hits', self.hits], ['misses', self.misses]]:
+                self.conn.execute('INSERT OR IGNORE INTO stats VALUES (?, 0)', [name])
+                self.conn.execute('UPDATE stats SET value = value + ? WHERE name = ?', [value, name])
+            size = self.conn.execute('SELECT TOTAL(size) FROM objects').fetchone()[0]
+            if size > self.max_size:
+                evicted = []
+                for key, entry_size in self.conn.execute('SELECT key, size FROM objects ORDER BY atime').fetchall():
+                    if size <= self.max_size:
+                        break
+                    if os.path.isfile(self.path(key)):
+                        os.remove(self.path(key))
+                    size -= entry_size
+                    evicted.append([key])
+                self.conn.executemany('DELETE FROM objects WHERE key = ?', evicted)
+        self.conn.close()
+
+# Get number of CPUs available to mimk
+def cpu_count():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+# Executor running jobs, hashing and dependency parsing in threads of mimk process
+class ThreadExecutor:
+    # Files are hashed one by one, as needed
+    batch_hash = False
+
+    def __init__(self, threads, digest='sha256'):
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        self.digest = digest
+        # File descriptors passed to external commands
+        self.pass_fds = ()
+
+    def submit(self, func, *params):
+        return self.pool.submit(func, *params)
+
+    # Get hash of file with given size
+    def hash(self, filename, size):
+        return digest_file(filename, self.digest)
+
+    # Parse dependency file with given size
+    def parse(self, dep_path, size):
+        return parse_dependencies(dep_path)
+
+    # Get job token before running an external command
+    @contextlib.contextmanager
+    def token(self):
+        yield
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+# Executor hashing files and parsing dependency files in a process pool, so that CPU-heavy work is not limited by the GIL
+class ProcessExecutor(ThreadExecutor):
+    # Smaller files are handled in the calling thread, as sending them to a process takes longer than hashing or parsing
+    min_size = 65536
+    # Files not hashed yet are collected and hashed in batches (see Session.prehash)
+    batch_hash = True
+
+    def __init__(self, threads, digest='sha256'):
+        super().__init__(threads, digest)
+        # Worker processes are started by a fork server, as forking a process with running threads is unsafe
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+        self.processes = concurrent.futures.ProcessPoolExecutor(max_workers=cpu_count(), mp_context=context)
+
+    def hash(self, filename, size):
+        if size < self.min_size:
+            return digest_file(filename, self.digest)
+        return self.processes.submit(digest_file, filename, self.digest).result()
+
+    # Get hashes of files with given sizes, spreading them over the worker processes in batches of about the same size
+    def hash_many(self, files):
+        total = sum(size for _, size in files)
+        if total < self.min_size:
+            return digest_files([filename for filename, _ in files], self.digest)
+        batch_size = max(self.min_size, total // cpu_count())
+        batches = [[]]
+        size_sum = 0
+        for filename, size in files:
+            if size_sum >= batch_size:
+                batches.append([])
+                size_sum = 0
+            batches[-1].append(filename)
+            size_sum += size
+        futures = [self.processes.submit(digest_files, batch, self.digest) for batch in batches]
+        return [hash for future in futures for hash in future.result()]
+
+    def parse(self, dep_path, size):
+        if size < self.min_size:
+            return parse_dependencies(dep_path)
+        return self.processes.submit(parse_dependencies, dep_path).result()
+
+    def shutdown(self):
+        super().shutdown()
+        self.processes.shutdown()
+
+# Executor sharing a job budget with other processes via GNU make's jobserver
+# Joins the jobserver of a parent make (MAKEFLAGS --jobserver-auth), or creates one for its commands and their sub-makes
+class JobserverExecutor(ThreadExecutor):
+    def __init__(self, threads, build_dir, digest='sha256'):
+        super().__init__(threads, digest)
+        self.fifo_path = None
+        self.makeflags = None
+        self.read_fd = self.write_fd = -1
+        # Every process using the jobserver owns one implicit token
+        self.implicit = True
+        self.lock = threading.Lock()
+        auth = None
+        for flag in shlex.split(os.environ.get('MAKEFLAGS', '')):
+            if flag.startswith(('--jobserver-auth=', '--jobserver-fds=')):
+                auth = flag.split('=', 1)[1]
+        if auth and auth.startswith('fifo:'):
+            self.read_fd = self.write_fd = os.open(auth[5:], os.O_RDWR | os.O_NONBLOCK)
+        elif auth:
+            read_fd, write_fd = [int(fd) for fd in auth.split(',')]
+            try:
+                os.fstat(read_fd)
+                os.fstat(write_fd)
+                self.read_fd, self.write_fd = read_fd, write_fd
+                self.pass_fds = (read_fd, write_fd)
+            except OSError:
+                color_print('Jobserver not available, prefix make rule with \'+\' to use it', 'yellow')
+        else:
+            # Create jobserver: FIFO holding one token for each job besides the implicit one
+            self.fifo_path = os.path.abspath(os.path.join(build_dir, '.mimk.jobserver'))
+            if os.path.exists(self.fifo_path):
+                os.remove(self.fifo_path)
+            os.mkfifo(self.fifo_path, 0o600)
+            self.read_fd = self.write_fd = os.open(self.fifo_path, os.O_RDWR | os.O_NONBLOCK)
+            os.write(self.write_fd, b'+' * (threads - 1))
+            self.makeflags = os.environ.get('MAKEFLAGS')
+            os.environ['MAKEFLAGS'] = ' '.join(flag for flag in [self.makeflags, '-j{}'.format(threads), '--jobserver-auth=fifo:' + self.fifo_path] if flag)
+
+    # Get implicit token, or read one token from jobserver (checking implicit token again while waiting)
+    def acquire(self):
+        while True:
+            with self.lock:
+                if self.implicit:
+                    self.implicit = False
+                    return None
+            if self.read_fd < 0:
+                time.sleep(0.01)
+                continue
+            if select.select([self.read_fd], [], [], 0.1)[0]:
+                try:
+                    token = os.read(self.read_fd, 1)
+                except BlockingIOError:
+                    # Token taken by another process
+                    continue
+                if token:
+                    return token
+
+    # Return token to jobserver
+    def release(self, token):
+        if token is None:
+            with self.lock:
+                self.implicit = True
+        else:
+            os.write(self.write_fd, token)
+
+    @contextlib.contextmanager
+    def token(self):
+        token = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(token)
+
+    def shutdown(self):
+        super().shutdown()
+        if self.fifo_path:
+            os.close(self.read_fd)
+            os.remove(self.fifo_path)
+            if self.makeflags is None:
+                del os.environ['MAKEFLAGS']
+            else:
+                os.environ['MAKEFLAGS'] = self.makeflags
+        elif self.read_fd >= 0 and not self.pass_fds:
+            os.close(self.read_fd)
+
+# Get default number of threads: more than CPUs, as threads mostly wait for external commands
+def default_threads():
+    return cpu_count() + 4
+
+# Get executor of given kind
+def open_executor(kind, threads, build_dir, digest='sha256'):
+    if kind == 'process':
+        return ProcessExecutor(threads, digest)
+    elif kind == 'jobserver':
+        return JobserverExecutor(threads, build_dir, digest)
+    elif kind != 'thread':
+        raise MimkError('Unknown executor type {}'.format(kind))
+    return ThreadExecutor(threads, digest)
 
 # Print progress
 def print_progress(iteration, total, name='', length=50):
@@ -80,15 +709,78 @@ def makedir(pathname):
         os.makedirs(pathname, exist_ok=True)
 
 # Remove file
-def remove(filename, ext=''):
-    global args
+def remove(session, filename, ext=''):
     if not os.path.isfile(filename):
         filename += ext
     if os.path.isfile(filename):
-        if not args.quiet:
+        if not session.args.quiet:
             color_print('Remove {}'.format(filename), 'magenta')
         os.remove(filename)
 
+# Clone file: reflink (copy-on-write) if supported, otherwise copy in the kernel
+# Never hardlink, so that changing one file in place (e.g. by strip) cannot change the other (e.g. in the object cache)
+def clone_file(src, dst):
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        if fcntl and sys.platform.startswith('linux'):
+            try:
+                fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+                return
+            except OSError:
+                pass
+        copy_data(src_file, dst_file)
+
+# Append data of open source file to open destination file in the kernel (copy_file_range, Linux only),
+# or by streaming it in chunks
+def copy_data(src_file, dst_file):
+    if hasattr(os, 'copy_file_range'):
+        dst_file.flush()
+        try:
+            while os.copy_file_range(src_file.fileno(), dst_file.fileno(), 1 << 30):
+                pass
+            return
+        except OSError:
+            # Not supported between these files (e.g. older kernel across file systems), continue with copied position
+            src_file.seek(os.lseek(src_file.fileno(), 0, os.SEEK_CUR))
+            dst_file.seek(os.lseek(dst_file.fileno(), 0, os.SEEK_CUR))
+    shutil.copyfileobj(src_file, dst_file, 1 << 20)
+
+# Copy file to dir/file with metadata (like shutil.copy2), without copying data through Python:
+# clone (reflink) if file system supports it, otherwise copy in the kernel
+def copy_file(src, dst):
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        raise shutil.SameFileError('{} and {} are the same file'.format(src, dst))
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        cloned = False
+        if fcntl and sys.platform.startswith('linux'):
+            try:
+                fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+                cloned = True
+            except OSError:
+                pass
+        if not cloned:
+            if hasattr(os, 'copy_file_range'):
+                copy_data(src_file, dst_file)
+            else:
+                dst_file.close()
+                shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
+    return dst
+
+# Move file to dir/file: rename on same file system, otherwise copy and remove
+def move_file(src, dst):
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        copy_file(src, dst)
+        os.remove(src)
+    return dst
+
 # Check if list of files exists
 def files_exist(file_list):
     exist_list = []
@@ -96,502 +788,406 @@ def files_exist(file_list):
         exist_list.append(os.path.isfile(file))
     return all(exist_list)
 
-# Issue command
-def run_command(command_str, undo=False, iteration=0, total=0, name=''):
-    global args
-    if command_str:
-        # Remember current working directory
-        wd = os.getcwd()
-        command_list = command_str.split(';');
-        for command in command_list:
-            if not args.quiet:
-                color_print('{}{}'.format('Undo 'if undo else '', command), 'cyan')
-            if command[0] == '@':
-                # Built-in commands start with @
-                param = [x for x in shlex.split(command[1:], posix=False) if x]
-                src_list = glob.glob(param[1]) if '*' in param[1] else [param[1]]
-                for src_file in src_list:
-                    if param[0] == 'copy':
-                        if not undo:
-                            # Copy file to dir/file
-                            shutil.copy2(src_file, param[2])
-                        else:
-                            # Undo: delete copied file
-                            head, tail = os.path.split(src_file)
-                            copied_file = os.path.join(param[2], tail)
-                            if os.path.isfile(copied_file):
-                                os.remove(copied_file)
-                    elif param[0] == 'move':
-                        if not undo:
-                            # Move file to dir/file
-                            shutil.copy2(src_file, param[2])
-                            os.remove(src_file)
-                        else:
-                            # Undo: reverse move
-                            if os.path.isdir(param[2]):
-                                head, tail = os.path.split(src_file)
-                                moved_file = os.path.join(param[2], tail)
-                                shutil.copy2(moved_file, head)
-                                os.remove(moved_file)
-                            elif os.path.isfile(param[2]):
-                                shutil.copy2(param[2], src_file)
-                                os.remove(param[2])
-                            elif not os.path.isfile(param[2]):
-                                if os.path.isfile(param[2] + '.exe'):
-                                    shutil.copy2(param[2] + '.exe', src_file)
-                                    os.remove(param[2] + '.exe')
-                    elif param[0] == 'rename':
-                        if not undo:
-                            # Rename file to file
-                            os.rename(src_file, param[2])
-                        else:
-                            # Undo: reverse rename
-                            os.rename(param[2], src_file)
-                    elif param[0] == 'makedir':
-                        if not undo:
-                            # Makedir
-                            makedir(src_file)
-                        else:
-                            # Undo: remove dir
-                            if os.path.isdir(src_file):
-                                shutil.rmtree(src_file)
-                    elif param[0] == 'delete':
-                        if not undo:
-                            # Delete dir/file
-                            if os.path.isdir(src_file):
-                                os.removedirs(src_file)
-                            elif os.path.isfile(src_file):
-                                os.remove(src_file)
-                            elif not os.path.isfile(src_file):
-                                if os.path.isfile(src_file + '.exe'):
-                                    os.remove(src_file + '.exe')
-                    elif param[0] == 'echo':
-                        if not undo:
-                            # Echo parameters into file
-                            with open(param[1], 'w') as echo_file:
-                                print(' '.join(param[2:]), file=echo_file)
-                        else:
-                            if os.path.isfile(param[1]):
-                                os.remove(param[1])
-                    elif param[0] == 'append':
-                        if not undo:
-                            # Append parameters to end of file
-                            with open(param[1], 'a') as append_file:
-                                print(' '.join(param[2:]), file=append_file)
-                        else:
-                            if os.path.isfile(param[1]):
-                                os.remove(param[1])
-                    elif param[0] == 'cat':
-                        if not undo:
-                            # Concatenate multiple files into one
-                            with open(param[1], 'w') as cat_file:
-                                for file in param[2:]:
-                                    with open(file) as infile:
-                                        cat_file.write(infile.read())
-                        else:
-                            if os.path.isfile(param[1]):
-                                os.remove(param[1])
-                    elif param[0] == 'cd':
-                        # Change directory
-                        os.chdir(src_file)
-                    elif param[0] == 'ok':
-                        if not undo:
-                            # Run external command, ignoring errors
-                            subprocess.run(' '.join(param[1:]), shell=True)
-                    elif param[0] == 'try':
-                        if not undo:
-                            tries = int(param[1])
-                            while tries > 0:
-                                # Run external command, trying several times if error occurs
-                                ret = subprocess.run(' '.join(param[2:]), shell=True).returncode
-                                if ret == 0:
-                                    break
-                                else:
-                                    tries -= 1
-                    elif param[0] == 'exists':
-                        if not undo:
-                            # Run external command if path exists, ignoring errors
-                            if os.path.exists(param[1]):
-                                subprocess.run(' '.join(param[2:]), shell=True)
-                    elif param[0] == 'python':
-                        if not undo:
-                            # Run python code
-                            exec(' '.join(param[1:]))
-            else:
-                if not undo:
-                    # Print progress
-                    if total > 0 and is_terminal():
-                        print_progress(iteration, total, name)
-                    # External command
-                    try:
-                        ret = subprocess.run(' '.join([x for x in shlex.split(command, posix=False) if x]), shell=True).returncode
-                        if not args.debug:
-                            if ret < 0:
-                                color_print('Command {} terminated by signal {}'.format(command.split(' ')[0], -ret))
-                                sys.exit(ret)
-                            elif ret > 0:
-                                color_print('Command {} returned error {}'.format(command.split(' ')[0], ret))
-                                sys.exit(ret)
-                    except OSError as e:
-                        color_print('Command execution failed: {}'.format(e))
-                        sys.exit(1)
-        # Restore working directory
-        os.chdir(wd)
-
-# Build dependency and source files, using threading
-def build_dep_and_src(lock, src_path, idx):
-    global config, dep_dir, obj_dir, base_offset, args, target, total, hash_dict, new_hash_dict, obj_list, obj_list_rel
-
-    # Convert separators
-    src_path = src_path.replace('/', os.sep)
-    src_name  = os.path.basename(src_path)
-    iteration = idx + 1
-
-    # Setup paths for dependency, source, and object files
-    dep = os.path.splitext(src_path)[0] + '.' + config['DEPEXT']
-    obj = os.path.splitext(src_path)[0] + '.' + config['OBJEXT']
-    dep_path = os.path.join(dep_dir, dep)
-    obj_path = os.path.join(obj_dir, obj)
-    makedir(os.path.split(dep_path)[0])
-    makedir(os.path.split(obj_path[base_offset:])[0])
-
-    # Remove dependency and object files if remove flag is set
-    if args.remove:
-        remove(dep_path)
-        remove(obj_path)
-        if 'REMRULE' in target and target['REMRULE']:
-            run_command(eval_rule(target['REMRULE'], config), iteration=iteration, total=total, name=src_name)
-        if 'PRERULE' in target and target['PRERULE']:
-            run_command(os.path.join(*eval_rule(target['PRERULE'], config).split('/')), undo=True, iteration=iteration, total=total, name=src_name)
-        return False
-
-    # Add paths to local thread's config
-    local_config = config.copy()
-    local_config['SRC_PATH'] = src_path
-    local_config['DEP_PATH'] = dep_path
-    local_config['OBJ_PATH'] = obj_path
-
-    # Create dependency file if it does not exist
-    dependencies = []
-    if not os.path.exists(dep_path):
-        if 'DEPRULE' in target and target['DEPRULE']:
-            command_dep = eval_rule(target['DEPRULE'], local_config)
-            run_command(command_dep)
-
-    # Firstly, assume file is modified
-    modified = True
-
-    # Get list of dependencies
-    if 'DEPRULE' in target and target['DEPRULE']:
+# Read output and error output of process until both pipes are closed
+def read_pipes(proc):
+    data = {proc.stdout: [], proc.stderr: []}
+    with selectors.DefaultSelector() as selector:
+        for pipe in data:
+            selector.register(pipe, selectors.EVENT_READ)
+        while selector.get_map():
+            for key, _ in selector.select():
+                chunk = os.read(key.fd, 1 << 16)
+                if chunk:
+                    data[key.fileobj].append(chunk)
+                else:
+                    selector.unregister(key.fileobj)
+    return b''.join(data[proc.stdout]), b''.join(data[proc.stderr])
+
+# Run external command, capturing its output and error output separately if job's output is captured, return exit code
+# A job token is held while the command runs, so that the jobserver's job budget is respected
+# Peak memory of command (if higher than that of mimk) is recorded for job, so that it can be used to throttle the job in the next build
+# Running processes are kept by session, so that they can be terminated when its build is cancelled ('--kill'),
+# and no command is started after that; each command runs in its own process group, so that its child processes are terminated too
+# Command is run in working folder cwd of its rule, the working folder of mimk is never changed, as other jobs run at the same time
+# Executables are started by a launcher if their runs are measured (see run_launcher)
+def run_process(session, command, cwd=''):
+    lines = getattr(job_output, 'lines', None)
+    pipe = subprocess.PIPE if lines is not None else None
+    runs = getattr(job_output, 'runs', None) if hasattr(os, 'posix_spawn') else None
+    popen_args, pass_fds = command, session.executor.pass_fds
+    with session.executor.token():
+        with session.process_lock:
+            if session.cancelled:
+                return -signal.SIGTERM
+            if runs is not None:
+                report_fd, launcher_fd = os.pipe()
+                popen_args = [sys.executable, '-S', '-c', run_launcher, str(launcher_fd), command]
+                pass_fds += (launcher_fd,)
+            try:
+                proc = subprocess.Popen(popen_args, shell=runs is None, stdout=pipe, stderr=pipe, pass_fds=pass_fds, cwd=cwd or None,
+                    start_new_session=hasattr(os, 'killpg'))
+            finally:
+                if runs is not None:
+                    os.close(launcher_fd)
+            session.processes.add(proc)
         try:
-            with open(dep_path) as dep_file:
-                dep_str = dep_file.read()
-            dependencies = unique_list(dep_str.replace(': ', ' ').replace(' \\', '').replace('\\', '/').replace('\n', '').replace('\r', '').split(' '))
-
-            # Sanity check
-            dep_obj_path = os.path.join(os.path.split(src_path)[0], dependencies[0])
-            if dep_obj_path != obj:
-                color_print('Error: mismatch in dependency file {}: Expected {}, got {}'.format(dep_path, obj, dep_obj_path))
-                sys.exit(1)
-
-            # Assume file is not modified unless one dependency file's hash is either missing or has changed
-            modified = False
-
-            # Check for all dependencies, starting with second (first is resulting object file)
-            for dep_path in dependencies[1:]:
-                # Check if file has been modified by checking its SHA-256 hash against a list of known hashes
-                hash = sha256file(dep_path)
+            if hasattr(os, 'wait4'):
+                out, err = read_pipes(proc) if pipe else (None, None)
+                # Wait with wait4, so that peak memory of command (including its child processes) is known
+                try:
+                    _, status, rusage = os.wait4(proc.pid, 0)
+                    proc.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+                    # A command starts with the peak memory of mimk (which it inherits when it is spawned),
+                    # so its own peak memory is only known if it is higher than that of mimk
+                    if rusage.ru_maxrss > resource.getrusage(resource.RUSAGE_SELF).ru_maxrss:
+                        job_output.memory = max(getattr(job_output, 'memory', 0), rusage.ru_maxrss / 1024)
+                except ChildProcessError:
+                    # Already reaped when terminating it
+                    proc.wait()
+                if runs is not None:
+                    report = os.read(report_fd, 256).split()
+                    if report:
+                        wall, maxrss, launcher_maxrss = float(report[0]), int(report[1]), int(report[2])
+                        runs.append({'wall': wall, 'maxrss_mb': maxrss / 1024 if maxrss > launcher_maxrss else None})
+            else:
+                out, err = proc.communicate()
+        finally:
+            if pipe:
+                proc.stdout.close()
+                proc.stderr.close()
+            if runs is not None:
+                os.close(report_fd)
+            with session.process_lock:
+                session.processes.discard(proc)
+    if out:
+        lines.append(out.decode(errors='replace').rstrip('\n'))
+    if err:
+        job_output.errors.append(err.decode(errors='replace').rstrip('\n'))
+    return proc.returncode
+
+# Launcher of measured executables: as a small process, the executable does not inherit the peak memory of mimk
+# It reports the wall time (without its own start-up time), the peak memory of the executable and its own peak memory (KB),
+# the executable's peak memory is only known if it is higher than that of the launcher (a few MB)
+run_launcher = '''
+import os, resource, sys, time
+start = time.perf_counter()
+pid = os.posix_spawn('/bin/sh', ['/bin/sh', '-c', sys.argv[2]], os.environ)
+_, status, rusage = os.wait4(pid, 0)
+wall = time.perf_counter() - start
+os.write(int(sys.argv[1]), '{} {} {}'.format(wall, rusage.ru_maxrss, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss).encode())
+if os.WIFSIGNALED(status):
+    os.kill(os.getpid(), os.WTERMSIG(status))
+sys.exit(os.WEXITSTATUS(status))
+'''
+
+# Terminate all running external processes of session (with their process groups), and do not start any further ones
+def terminate_processes(session):
+    with session.process_lock:
+        session.cancelled = True
+        for proc in session.processes:
+            try:
+                if hasattr(os, 'killpg'):
+                    os.killpg(proc.pid, signal.SIGTERM)
+                else:
+                    proc.terminate()
+            except OSError:
+                pass
 
-                if dep_path in hash_dict:
-                    if hash_dict[dep_path] != hash:
-                        # Different hash, so file has been modified
-                        modified = True
-                        break
+# Run internal command on one (of possibly several) matching files
+# Paths are relative to working folder cwd of rule (src_file is already resolved)
+def run_internal_command(session, param, src_file, undo=False, cwd=''):
+    if len(param) > 2 and param[0] in ['copy', 'move', 'rename']:
+        param = param[:2] + [os.path.join(cwd, param[2])] + param[3:]
+    if param[0] == 'copy':
+        if not undo:
+            # Copy file to dir/file
+            copy_file(src_file, param[2])
+        else:
+            # Undo: delete copied file
+            head, tail = os.path.split(src_file)
+            copied_file = os.path.join(param[2], tail)
+            if os.path.isfile(copied_file):
+                os.remove(copied_file)
+    elif param[0] == 'move':
+        if not undo:
+            # Move file to dir/file
+            move_file(src_file, param[2])
+        else:
+            # Undo: reverse move
+            if os.path.isdir(param[2]):
+                head, tail = os.path.split(src_file)
+                move_file(os.path.join(param[2], tail), head or '.')
+            elif os.path.isfile(param[2]):
+                move_file(param[2], src_file)
+            elif not os.path.isfile(param[2]):
+                if os.path.isfile(param[2] + '.exe'):
+                    move_file(param[2] + '.exe', src_file)
+    elif param[0] == 'rename':
+        if not undo:
+            # Rename file to file
+            os.rename(src_file, param[2])
+        else:
+            # Undo: reverse rename
+            os.rename(param[2], src_file)
+    elif param[0] == 'makedir':
+        if not undo:
+            # Makedir
+            makedir(src_file)
+        else:
+            # Undo: remove dir
+            if os.path.isdir(src_file):
+                shutil.rmtree(src_file)
+    elif param[0] == 'delete':
+        if not undo:
+            # Delete dir/file
+            if os.path.isdir(src_file):
+                os.removedirs(src_file)
+            elif os.path.isfile(src_file):
+                os.remove(src_file)
+            elif not os.path.isfile(src_file):
+                if os.path.isfile(src_file + '.exe'):
+                    os.remove(src_file + '.exe')
+    elif param[0] == 'echo':
+        if not undo:
+            # Echo parameters into file
+            with open(src_file, 'w') as echo_file:
+                print(' '.join(param[2:]), file=echo_file)
+        else:
+            if os.path.isfile(src_file):
+                os.remove(src_file)
+    elif param[0] == 'append':
+        if not undo:
+            # Append parameters to end of file
+            with open(src_file, 'a') as append_file:
+                print(' '.join(param[2:]), file=append_file)
+        else:
+            if os.path.isfile(src_file):
+                os.remove(src_file)
+    elif param[0] == 'cat':
+        if not undo:
+            # Concatenate multiple files (or files matching wildcards) into one, streaming binary data
+            # Wildcards are expanded before the destination file is created, and never match the destination file
+            files = []
+            for pattern in param[2:]:
+                if '*' in pattern:
+                    files += [file for file in sorted(glob.glob(os.path.join(cwd, pattern)))
+                        if not (os.path.exists(src_file) and os.path.samefile(file, src_file))]
                 else:
-                    # New file, mark as modified
-                    modified = True
+                    files.append(os.path.join(cwd, pattern))
+            with open(src_file, 'wb') as cat_file:
+                for file in files:
+                    with open(file, 'rb') as infile:
+                        copy_data(infile, cat_file)
+        else:
+            if os.path.isfile(src_file):
+                os.remove(src_file)
+    elif param[0] == 'ok':
+        if not undo:
+            # Run external command, ignoring errors
+            run_process(session, ' '.join(param[1:]), cwd)
+    elif param[0] == 'try':
+        if not undo:
+            tries = int(param[1])
+            while tries > 0:
+                # Run external command, trying several times if error occurs
+                ret = run_process(session, ' '.join(param[2:]), cwd)
+                if ret == 0:
                     break
-        except:
-            pass
-
-    # Check if object file exists
-    if not os.path.exists(obj_path):
-        modified = True
-
-    if modified:
-        # Compile source file
-        if 'SRCRULE' in target and target['SRCRULE']:
-            command_src = eval_rule(target['SRCRULE'], local_config)
-            #with lock:
-            run_command(command_src, iteration=iteration, total=total, name=src_name)
-
-        # Add dependencies' hashes to new dictionary
-        if dependencies:
-            for dep_path in dependencies[1:]:
-                hash = sha256file(dep_path)
-                if hash != -1:
-                    with lock:
-                        new_hash_dict[dep_path] = hash
-
-    # After object file has been compiled, append it to list
-    with lock:
-        obj_list.append(obj_path)
-        obj_list_rel.append(obj[base_offset:])
-
-    return modified
-
-# Main program
-total_time_start = datetime.datetime.now()
-execute_elapsed = total_time_start - total_time_start
-
-# Set config path
-config_dir = next((dir for dir in ['mimk', 'cfg'] if os.path.isdir(dir)), '')
-
-# Check init file and create it if it doesn't exist
-init_file = os.path.join(config_dir, '__init__.py')
-if not os.path.isfile(init_file):
-    open(init_file, 'a').close()
-
-# Prevent *.pyc file creation
-sys.dont_write_bytecode=True
-
-# Get list of target and config files
-target_choices = []
-config_choices = []
-for file in os.listdir(config_dir):
-    if file.endswith('.py'):
-        module_file = os.path.splitext(file)[0]
-        try:
-            module = importlib.import_module(config_dir + ('' if config_dir == '' else '.') + module_file, package=None)
-            if hasattr(module, 'targets'):
-                target_choices.append(module_file)
-            elif hasattr(module, 'config'):
-                config_choices.append(module_file)
-        except ImportError as e:
-            pass
-
-# Default compiler
-default_compiler = os.environ.get('MIMK_COMPILER', 'gcc_release')
-
-# Argument parsing
-global args
-parser = argparse.ArgumentParser(description='mimk - Minimal make')
-parser.add_argument('target', choices=target_choices, help='Target configuration file')
-parser.add_argument('-a', '--arg', nargs='*', help='Add argument(s)')
-parser.add_argument('-c', '--config', choices=config_choices, default=default_compiler, help='Compiler configuration file')
-parser.add_argument('-d', '--debug', action='store_true', help='Debug mode, do not stop on errors')
-parser.add_argument('-l', '--list', action='store_true', help='List targets')
-parser.add_argument('-q', '--quiet', action='store_true', help='Quiet output')
-parser.add_argument('-r', '--remove', action='store_true', help='Remove all dependency, object and executable files and undo pre-processing rule')
-parser.add_argument('-s', '--source', nargs='*', help='Source folder(s), overrides SRCDIR')
-parser.add_argument('-t', '--threads', type=int, choices=range(0, 33), default=0, help='Number of threads (0: default, 1: turn off threading)')
-parser.add_argument('-v', '--verbose', action='store_true', help='Verbose output')
-parser.add_argument('-w', '--wipe', action='store_true', help='Wipe build database')
-parser.add_argument('-x', '--execute', nargs='*', help='Execute specific target(s)')
-parser.add_argument('-y', '--exclude', nargs='*', help='Exclude specific target(s)')
-args = parser.parse_args()
-
-# Start message
-color_print('mimk - Minimal make v{} ({})'.format(mimk_version, mimk_date), 'yellow')
-
-# Set default config
-config = {
-    'BUILD':    args.config,
-    'DEPPATH':  'dep',
-    'OBJPATH':  'obj',
-    'SRCEXT':   'c',
-    'INCEXT':   'h',
-    'DEPEXT':   'd',
-    'OBJEXT':   'o'
-}
-
-# Import config and target
-try:
-    config_module = importlib.import_module(config_dir + ('' if config_dir == '' else '.') + args.config, package=None)
-    if hasattr(config_module, 'config'):
-        config.update(config_module.config)
-except ImportError as e:
-    color_print('Could not load config file {}.py: {}'.format(os.path.join(config_dir, args.config), e))
-    sys.exit(1)
-try:
-    target_module = importlib.import_module(config_dir + ('' if config_dir == '' else '.') + args.target, package=None)
-    targets = target_module.targets
-    target_dict = {}
-    for item in dir(target_module):
-        if not item.startswith('__'):
-            target_attr = getattr(target_module, item)
-            if isinstance(target_attr, dict):
-                if 'TARGET' in target_attr:
-                    target_dict[item] = target_attr['TARGET']
-    if hasattr(target_module, 'config'):
-        config.update(target_module.config)
-except ImportError as e:
-    color_print('Could not load target file {}.py: {}'.format(os.path.join(config_dir, args.target), e))
-    sys.exit(1)
-std_dep_path = config['DEPPATH']
-std_obj_path = config['OBJPATH']
-if not args.quiet:
-    color_print('{}'.format(config['BUILD']), 'cyan', 'Build:  ')
-
-# Remove init file
-if os.path.isfile(init_file):
-    os.remove(init_file)
-
-# List option
-if args.list:
-    for target in targets:
-        if target['TARGET']:
-            color_print('{}'.format(target['TARGET']), 'green')
-    for target in target_dict:
-        color_print('{}'.format(target), 'green')
-    sys.exit(0)
-
-# Execute option, also support variable name
-if args.execute:
-    new_execute_list = []
-    for execute in args.execute:
-        if execute in target_dict:
-            new_execute_list.append(target_dict[execute])
-            target_attr = getattr(target_module, execute)
-            if isinstance(target_attr, dict):
-                if 'TARGET' in target_attr:
-                    if not any(target['TARGET'] == target_attr['TARGET'] for target in targets):
-                        targets.append(target_attr)
+                else:
+                    tries -= 1
+    elif param[0] == 'exists':
+        if not undo:
+            # Run external command if path exists, ignoring errors
+            if os.path.exists(os.path.join(cwd, param[1])):
+                run_process(session, ' '.join(param[2:]), cwd)
+    elif param[0] == 'python':
+        if not undo:
+            # Run python code
+            exec(' '.join(param[1:]))
+
+# Internal commands that are run in parallel for files matching a wildcard
+parallel_commands = ['copy', 'move', 'delete', 'makedir']
+
+# Issue single command in working folder cwd, return False if an external command failed (debug mode only)
+def run_single_command(session, command, undo=False, iteration=0, total=0, name='', cwd=''):
+    args = session.args
+    success = True
+    if command[0] == '@':
+        # Built-in commands start with @
+        param = [x for x in shlex.split(command[1:], posix=False) if x]
+        src_path = os.path.join(cwd, param[1])
+        src_list = glob.glob(src_path) if '*' in param[1] else [src_path]
+        if len(src_list) > 1 and param[0] in parallel_commands:
+            # Files matching wildcard are handled in parallel
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(src_list), default_threads())) as pool:
+                for future in [pool.submit(run_internal_command, session, param, src_file, undo, cwd) for src_file in src_list]:
+                    future.result()
         else:
-            color_print('Could not find target {} to execute'.format(execute))
-            sys.exit(1)
-    args.execute = new_execute_list
-
-# Exclude option
-for exclude in args.exclude or []:
-    if exclude in target_dict:
-        target_attr = getattr(target_module, exclude)
-        if isinstance(target_attr, dict):
-            if 'TARGET' in target_attr:
-                targets.remove(target_attr)
+            for src_file in src_list:
+                run_internal_command(session, param, src_file, undo, cwd)
     else:
-        color_print('Could not find target {} to exclude'.format(exclude))
-        sys.exit(1)
-    if args.execute and exclude in args.execute:
-        args.execute.remove(exclude)
-
-# Build dir paths
-build_dir = os.path.join('build', config['BUILD'])
-hashes_file = '.hashes.json'
-hashes_path = os.path.join(build_dir, hashes_file)
-
-# Wipe build database
-if args.wipe and os.path.isdir(build_dir):
-    try:
-        os.remove(hashes_path)
-        shutil.rmtree(build_dir)
-    except Exception:
-        pass
+        if not undo:
+            # Print progress
+            if total > 0 and is_terminal():
+                print_progress(iteration, total, name)
+            # External command
+            try:
+                ret = run_process(session, ' '.join([x for x in shlex.split(command, posix=False) if x]), cwd)
+                success = success and ret == 0
+                if not args.debug:
+                    if ret < 0:
+                        color_print('Command {} terminated by signal {}'.format(command.split(' ')[0], -ret))
+                        sys.exit(ret)
+                    elif ret > 0:
+                        color_print('Command {} returned error {}'.format(command.split(' ')[0], ret))
+                        sys.exit(ret)
+            except OSError as e:
+                color_print('Command execution failed: {}'.format(e))
+                sys.exit(1)
+    return success
 
-# Create build directory
-config['BUILD_DIR'] = build_dir
-makedir(build_dir)
+# Issue command, return False if an external command failed (debug mode only)
+def run_command(session, command_str, undo=False, iteration=0, total=0, name='', rule='', target=''):
+    args = session.args
+    success = True
+    if command_str:
+        # Working folder of following commands, changed by @cd (relative to working folder of mimk)
+        cwd = ''
+        command_list = command_str.split(';');
+        for command in command_list:
+            if not args.quiet:
+                color_print('{}{}'.format('Undo 'if undo else '', command), 'cyan')
+            with trace(command, ('Undo ' if undo else '') + (rule or 'command'), target=target, source=name):
+                param = [x for x in shlex.split(command[1:], posix=False) if x] if command.startswith('@') else []
+                if param and param[0] == 'cd':
+                    # Change directory
+                    cwd = os.path.normpath(os.path.join(cwd, param[1]))
+                else:
+                    success = run_single_command(session, command, undo, iteration, total, name, cwd) and success
+    return success
+
+# Target state while building the target graph
+class Target:
+    def __init__(self, session, index, target, config):
+        self.session = session
+        self.index = index
+        self.target = target
+        self.config = config
+        self.name = target['TARGET']
+        self.path = config['TARGET_PATH']
+        self.path_dict = config['BUILD_DIR'] + '/' + target['TARGET']
+        self.dep_dir = config['DEP_DIR']
+        self.obj_dir = config['OBJ_DIR']
+        self.base_offset = len(target['SRCBASE']) + 1 if 'SRCBASE' in target else 0
+        # Dependency files are generated by DEPRULE, or as a side output of SRCRULE (e.g. '-MMD -MF $DEP_PATH')
+        self.dep_rule = bool(target.get('DEPRULE'))
+        self.dep_in_src = not self.dep_rule and any(var in target.get('SRCRULE', '') for var in ['$DEP_PATH', '${DEP_PATH}'])
+        # Maximum number of concurrent jobs of this target (0: no limit)
+        self.threads = target['THREADS'] if target.get('THREADS', 0) > 0 else 0
+        # Targets that must be done before this target is prepared or linked
+        self.prepare_after = []
+        self.link_after = []
+        # State: waiting, preparing, compiling, compiled, linking, running, done
+        self.state = 'waiting'
+        self.ready = []
+        self.running = 0
+        self.sources = []
+        self.pending = 0
+        self.up_to_date = False
+        self.modified_any = False
+        self.relinked = False
+        self.changed = False
+        self.new_hash_dict = {}
+        self.new_dep_dict = {}
+        self.removed_hashes = []
+        self.new_durations = {}
+        self.new_memory = {}
+        self.new_commands = {}
+        self.new_objects = {}
+        # Precompiled header, and whether it has been rebuilt with a changed content
+        self.pch = None
+        self.pch_modified = False
+        # Wall times and peak memory of executable runs (EXERULE)
+        self.run_stats = None
+        self.lock = threading.Lock()
+
+# Source file of a target, with paths of its dependency and object files
+class Source:
+    def __init__(self, tgt, src_path, idx, rel_path=None):
+        # Convert separators
+        self.src_path = src_path.replace('/', os.sep)
+        self.name = os.path.basename(self.src_path)
+        self.iteration = idx + 1
+        self.dep = os.path.splitext(self.src_path)[0] + '.' + tgt.config['DEPEXT']
+        self.obj = os.path.splitext(self.src_path)[0] + '.' + tgt.config['OBJEXT']
+        # Paths in dependency and object folders follow source path, or given relative path (generated sources)
+        rel_base = os.path.splitext(rel_path)[0] if rel_path else None
+        self.dep_path = os.path.join(tgt.dep_dir, rel_base + '.' + tgt.config['DEPEXT'] if rel_path else self.dep)
+        self.obj_path = os.path.join(tgt.obj_dir, rel_base + '.' + tgt.config['OBJEXT'] if rel_path else self.obj)
+        self.obj_rel = rel_base + '.' + tgt.config['OBJEXT'] if rel_path else self.obj[tgt.base_offset:]
+        self.dependencies = []
+        # Rule compiling source file (PCHRULE for precompiled header)
+        self.rule = 'SRCRULE'
+        # Source files included by generated unity build batch
+        self.batch = []
+
+# Precompiled header of target, built like a source file by PCHRULE into PCH_PATH
+def pch_source(tgt):
+    pch = Source(tgt, tgt.target['PCH'], 0, os.path.join('pch', tgt.name, os.path.basename(tgt.target['PCH'])))
+    pch.obj_path = tgt.config['PCH_PATH']
+    pch.rule = 'PCHRULE'
+    return pch
+
+# Run pre-processing rule and get list of target's source files
+def prepare_target(tgt):
+    session = tgt.session
+    args = session.args
+    target = tgt.target
+    config = tgt.config
+    color_print('{}'.format(tgt.name), 'green', 'Target: ')
+
+    # Run pre-processing rule (not in a dry run)
+    if not session.dry:
+        if 'PRERULE' in target and target['PRERULE']:
+            run_command(session, os.path.join(*eval_rule(target['PRERULE'], config).split('/')), rule='PRERULE', target=tgt.name)
+            # Pre-processing may have changed any file
+            session.uncache_hash()
 
-# Read hashes from file
-try:
-    hash_dict = json.load(open(hashes_path, 'r'))
-except Exception:
-    hash_dict = {}
-
-# Print statistics
-if args.verbose:
-    hash_src = 0
-    hash_inc = 0
-    hash_trgt = 0
-    for hash_key in hash_dict:
-        hash_ext = os.path.splitext(hash_key)[1][1:]
-        if hash_ext == config['SRCEXT']:
-            hash_src += 1
-        elif hash_ext == config['INCEXT']:
-            hash_inc += 1
+    # Get source files list
+    src_files = find_sources(tgt)
+    if src_files is None:
+        return None
+    sources = [Source(tgt, src_path, idx) for idx, src_path in enumerate(src_files)]
+    if target.get('UNITY'):
+        sources = unity_sources(tgt, sources, not session.dry)
+    tgt.pch = pch_source(tgt) if target.get('PCH') and target.get('PCHRULE') else None
+
+    # Skip all per-file work if target is unchanged since it was last built
+    tgt.up_to_date = manifest_unchanged(tgt, sources)
+    if not args.quiet:
+        if tgt.up_to_date:
+            color_print('Up to date', 'reset')
         else:
-            hash_trgt += 1
-    color_print('Loaded hash dictionary with {} entries (src: {}, inc: {}, trgt: {}).'.format(len(hash_dict), hash_src, hash_inc, hash_trgt), 'reset')
-
-# Process targets
-previous = []
-for index, target in enumerate(targets):
-    # If defined, target extensions override config extensions
-    if 'SRCEXT' in target:
-        config['SRCEXT'] = target['SRCEXT']
-    if 'INCEXT' in target:
-        config['INCEXT'] = target['INCEXT']
-    if 'DEPEXT' in target:
-        config['DEPEXT'] = target['DEPEXT']
-    if 'OBJEXT' in target:
-        config['OBJEXT'] = target['OBJEXT']
-    config['DEPPATH'] = target['DEPPATH'] if 'DEPPATH' in target else std_dep_path
-    config['OBJPATH'] = target['OBJPATH'] if 'OBJPATH' in target else std_obj_path
-
-    # Dep and obj sub-folders
-    dep_dir = os.path.join(build_dir, config['DEPPATH'])
-    obj_dir = os.path.join(build_dir, config['OBJPATH'])
-
-    # Wipe object folder
-    if args.wipe and os.path.isdir(obj_dir):
-        try:
-            shutil.rmtree(obj_dir)
-        except Exception:
-            pass
-
-    # Create dep and obj sub-folders
-    config['DEP_DIR'] = dep_dir
-    makedir(dep_dir)
-    config['OBJ_DIR'] = obj_dir
-    makedir(obj_dir)
-
-    # Check target
-    if 'TARGET' not in target:
-        color_print('No target defined in section #{} of file {}.py'.format(str(index), args.target))
-        continue
-
-    # Arg option
-    arg = args.arg if args.arg else []
-    config['ARGS'] = ' '.join(arg)
-
-    # Copy target names (i.e., all names starting with 'TARGET') to config
-    config.update([[key, value] for key, value in target.items() if key.startswith('TARGET')])
+            batches = sum(1 for src in sources if src.batch)
+            if batches:
+                color_print('Processing {} source files ({} unity batches, {} standalone)...'.format(len(src_files), batches, len(sources) - batches), 'reset')
+            else:
+                color_print('Processing {} source files...'.format(len(src_files)), 'reset')
 
-    # Execute only specific target(s)
-    if args.execute:
-        if target['TARGET'] not in args.execute:
-            continue
-    color_print('{}'.format(target['TARGET']), 'green', 'Target: ')
-
-    # Create target path and add to current config
-    target_path = os.path.join(build_dir, target['TARGET'])
-    target_path_dict = build_dir + '/' + target['TARGET']
-    config['TARGET_PATH'] = target_path
-
-    # Source folder
-    base_offset = 0
-    if 'SRCBASE' in target:
-        config['SRCBASE'] = target['SRCBASE']
-        base_offset = len(target['SRCBASE']) + 1
-    if 'SRCDIR' in target:
-        config['SRCDIR'] = target['SRCDIR']
-    if args.source:
-        target['SRCDIR'] = ' '.join(args.source)
-        config['SRCDIR'] = target['SRCDIR']
-
-    # Run pre-processing rule
-    if not args.remove:
-        if 'PRERULE' in target and target['PRERULE']:
-            run_command(os.path.join(*eval_rule(target['PRERULE'], config).split('/')))
+    return sources
 
-    # Get source files list
+# Get list of target's source files, or None if there are none
+def find_sources(tgt):
+    session = tgt.session
+    target = tgt.target
+    config = tgt.config
     src_files = []
-    if getattr(target_module, 'src_files', None):
+    if getattr(session.target_module, 'src_files', None):
         # Get list of source files from target configuration
-        src_files = target_module.src_files
+        src_files = session.target_module.src_files
         if not files_exist(src_files):
             color_print('At least one source file could not be found: {}'.format(src_files))
-            continue
+            return None
     elif 'SRCDIR' in target:
         # Get list of all SRCEXT files from SRCDIR
         try:
@@ -603,46 +1199,374 @@ for index, target in enumerate(targets):
             pass
         if not src_files:
             color_print('No source files found matching pattern ({})*.{}'.format(target['SRCDIR'], config['SRCEXT']))
+            return None
+    return src_files
+
+# Get unity build settings of target: maximum number of source files, size (bytes) and expected compile time (seconds) of a batch,
+# and whether changed source files are taken out of their batch
+def unity_settings(unity):
+    settings = {'FILES': 16, 'SIZE': 0, 'TIME': 0, 'ISOLATE': True}
+    if isinstance(unity, dict):
+        settings.update(unity)
+    elif not isinstance(unity, bool):
+        settings['FILES'] = unity
+    return settings
+
+# Unity build: combine target's source files into generated batch source files including several source files each
+# Batches are kept between builds (in 'unity.json'), so that an edit only rebuilds the batch containing the edited file;
+# the edited file is then compiled standalone, so that further edits only rebuild this file
+def unity_sources(tgt, sources, write=True):
+    session = tgt.session
+    config = tgt.config
+    durations = session.store.durations
+    settings = unity_settings(tgt.target['UNITY'])
+    unity_dir = os.path.join(session.build_dir, 'unity', tgt.name)
+    state_path = os.path.join(unity_dir, 'unity.json')
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+        if state['settings'] != settings:
+            raise ValueError('Settings changed')
+    except (OSError, ValueError, KeyError):
+        state = {'settings': settings, 'batches': [], 'isolated': []}
+
+    # Drop removed source files, and take changed source files out of their batch
+    by_path = dict((src.src_path, src) for src in sources)
+    isolated = [path for path in state['isolated'] if path in by_path]
+    batches = []
+    for batch_id, paths in state['batches']:
+        paths = [path for path in paths if path in by_path and path not in isolated]
+        if settings['ISOLATE']:
+            changed = [path for path in paths if path in session.hash_dict and session.hash_file(path) != stored_hash(session.hash_dict[path])]
+            isolated.extend(changed)
+            paths = [path for path in paths if path not in changed]
+        batches.append([batch_id, paths])
+
+    # Add new source files to last batch as long as it is within budget, otherwise start a new batch
+    # Expected compile time of a source file is recorded when compiled standalone, or as its share of its batch's compile time
+    def cost(path):
+        stat = file_stat(path)
+        return [1, stat[0] if stat else 0, durations.get('SRCRULE ' + by_path[path].obj_path, 0)]
+    batched = set(path for _, paths in batches for path in paths)
+    for path in sorted(set(by_path) - batched - set(isolated)):
+        if batches:
+            total = [sum(c) for c in zip(*[cost(p) for p in batches[-1][1] + [path]])]
+            if all(not limit or value <= limit for value, limit in zip(total, [settings['FILES'], settings['SIZE'], settings['TIME']])):
+                batches[-1][1].append(path)
+                continue
+        batches.append([max([batch_id for batch_id, _ in batches] or [-1]) + 1, [path]])
+
+    # Write batch source files (only if changed, so that unchanged batches keep their stat), remove files of empty batches
+    result = []
+    for batch_id, paths in batches:
+        batch_path = os.path.join(unity_dir, 'unity{}.{}'.format(batch_id, config['SRCEXT']))
+        if not paths:
+            if write and os.path.isfile(batch_path):
+                os.remove(batch_path)
             continue
+        batch = Source(tgt, batch_path, 0, os.path.join('unity', tgt.name, os.path.basename(batch_path)))
+        batch.batch = [by_path[path] for path in paths]
+        result.append(batch)
+        if write:
+            content = '/* Unity build batch of target {}, generated by mimk */\n'.format(tgt.name) + \
+                ''.join('#include "{}"\n'.format(os.path.relpath(path, unity_dir).replace(os.sep, '/')) for path in paths)
+            try:
+                with open(batch_path) as f:
+                    unchanged = f.read() == content
+            except OSError:
+                unchanged = False
+            if not unchanged:
+                makedir(unity_dir)
+                with open(batch_path, 'w') as f:
+                    f.write(content)
+                session.uncache_hash(batch_path)
+            makedir(os.path.split(batch.dep_path)[0])
+            makedir(os.path.split(batch.obj_path)[0])
+    if write:
+        state = {'settings': settings, 'batches': [batch for batch in batches if batch[1]], 'isolated': isolated}
+        makedir(unity_dir)
+        with open(state_path, 'w') as f:
+            json.dump(state, f, indent=1)
+
+    result.extend(by_path[path] for path in isolated)
+    for idx, src in enumerate(result):
+        src.iteration = idx + 1
+    return result
+
+# Get manifest key of target: its evaluated rules and list of source files
+def manifest_key(tgt, sources):
+    config = {k: v for k, v in tgt.config.items() if k not in ['OBJ_LIST', 'OBJ_LIST_REL', 'DEPENDS']}
+    rules = sorted([k, eval_rule(v, config)] for k, v in tgt.target.items() if isinstance(v, str))
+    return hashlib.sha256(json.dumps([rules, [src.src_path for src in sources]]).encode()).hexdigest()
+
+# Get aggregated digest of files' hash entries, or None if any file is unknown
+def manifest_digest(files, entries):
+    hash_sha256 = hashlib.sha256()
+    for path, ext in files:
+        entry = entries(path)
+        if not isinstance(entry, list):
+            return None
+        hash_sha256.update((path + '\0' + entry[3] + '\0').encode())
+    return hash_sha256.hexdigest()
 
-    if not args.quiet:
-        color_print('Processing {} source files...'.format(len(src_files)), 'reset')
-
-    # Compile all files
-    new_hash_dict = {}
-    obj_list = []
-    obj_list_rel = []
-    modified_any = False
-    total = len(src_files)
-
-    # Create lock
-    lock = threading.Lock()
-
-    # Set number of threads
-    threads = args.threads if args.threads > 0 else None
-    if 'THREADS' in target:
-        threads = target['THREADS'] if target['THREADS'] > 0 else None
-    if args.remove:
-        threads = 1
+# Check target's manifest: as long as no file's stat has changed, this needs no hashing at all
+def manifest_unchanged(tgt, sources):
+    session = tgt.session
+    manifest = session.store.manifests.get(tgt.path_dict)
+    if not manifest or manifest[0] != manifest_key(tgt, sources):
+        return False
+    with trace('Check manifest', 'hash', target=tgt.name):
+        for path, ext in manifest[2]:
+            entry = session.file_entry(path, ext)
+            if entry is None or entry is not session.hash_dict.get(path):
+                return False
+        # Files may have been rebuilt by another target since, so their hashes must match as well
+        return manifest_digest(manifest[2], session.hash_dict.get) == manifest[1]
+
+# Get new manifest of target after it has been built, or nothing if not all dependencies are known
+def target_manifest(tgt):
+    session = tgt.session
+    if tgt.up_to_date or not (tgt.dep_rule or tgt.dep_in_src):
+        return {}
+    files = []
+    for src in tgt.sources + ([tgt.pch] if tgt.pch else []):
+        if not src.dependencies:
+            return {}
+        files.extend([dep, ''] for dep in src.dependencies[1:])
+        files.append([src.obj_path, ''])
+    files.append([tgt.path_dict, '.exe'])
+    files = [list(file) for file in unique_list([tuple(file) for file in files])]
+    digest = manifest_digest(files, lambda path: tgt.new_hash_dict.get(path, session.hash_dict.get(path)))
+    if digest is None:
+        return {}
+    return {tgt.path_dict: [manifest_key(tgt, tgt.sources), digest, files]}
+
+# Parse dependency file into list of dependencies, the first entry being the object file
+def parse_dependencies(dep_path):
+    with open(dep_path) as dep_file:
+        dep_str = dep_file.read()
+    return unique_list(dep_str.replace(': ', ' ').replace(' \\', '').replace('\\', '/').replace('\n', '').replace('\r', '').split(' '))
+
+# Read list of dependencies from dependency file, the first entry being the object file
+# Parsed list is taken from build database as long as dependency file is unchanged
+def read_dependencies(tgt, src):
+    session = tgt.session
+    dep_path = src.dep_path
+    dep_stat = file_stat(dep_path)
+    # Object files depend on target's precompiled header as well, which dependency files do not list
+    pch = [tgt.pch.obj_path] if tgt.pch and src is not tgt.pch else []
+    if dep_stat and dep_path in session.dep_dict and session.dep_dict[dep_path][:3] == dep_stat:
+        dependencies = session.dep_dict[dep_path][3]
+        return dependencies + [path for path in pch if path not in dependencies]
+    dependencies = session.executor.parse(dep_path, dep_stat[0] if dep_stat else 0)
+
+    # Sanity check, object file is relative to source folder or (if generated while compiling) the full object path
+    dep_obj_path = os.path.join(os.path.split(src.src_path)[0], dependencies[0])
+    if dep_obj_path != src.obj and dependencies[0] != src.obj_path.replace(os.sep, '/'):
+        color_print('Error: mismatch in dependency file {}: Expected {}, got {}'.format(dep_path, src.obj, dep_obj_path))
+        sys.exit(1)
+
+    if dep_stat:
+        with tgt.lock:
+            tgt.new_dep_dict[dep_path] = stored_stat(dep_stat, session.run_start_ns) + [dependencies]
+            # Reverse dependency index, with normalized paths of dependencies
+            tgt.new_objects[src.obj_path] = [tgt.path_dict, unique_list([os.path.normpath(dep) for dep in dependencies[1:] + pch])]
+    return dependencies + [path for path in pch if path not in dependencies]
 
-    # Concurrently get source file dependencies and compile source files
-    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
-        futures = []
-        for idx, src_path in enumerate(src_files):
-            futures.append(executor.submit(build_dep_and_src, lock=lock, src_path=src_path, idx=idx))
+# Check whether object file needs to be rebuilt, return reason (None if up to date) and list of dependencies
+def object_reason(tgt, src, command):
+    session = tgt.session
+    dependencies = []
 
-        for future in concurrent.futures.as_completed(futures):
-            modified = future.result()
-            if modified:
-                # Set modified_any flag
-                modified_any = True
+    # Firstly, assume file is modified
+    reason = 'no dependency information'
 
-    # Add object list to current config
-    config['OBJ_LIST'] = ' '.join(obj_list)
-    config['OBJ_LIST_REL'] = ' '.join(obj_list_rel)
+    # Get list of dependencies
+    if tgt.dep_rule or tgt.dep_in_src:
+        with trace('Check dependencies', 'hash', target=tgt.name, source=src.name):
+            try:
+                dependencies = read_dependencies(tgt, src)
+                if session.executor.batch_hash:
+                    session.prehash(dependencies[1:])
+
+                # Assume file is not modified unless one dependency file's hash is either missing or has changed
+                reason = None
+
+                # Check for all dependencies, starting with second (first is resulting object file)
+                for dep_path in dependencies[1:]:
+                    # Check if file has been modified by checking its SHA-256 hash against a list of known hashes
+                    hash = session.hash_file(dep_path)
+
+                    if dep_path in session.hash_dict:
+                        if stored_hash(session.hash_dict[dep_path]) != hash:
+                            # Different hash, so file has been modified
+                            reason = 'changed dependency {}'.format(dep_path) if hash != -1 else 'missing dependency {}'.format(dep_path)
+                            break
+                        elif session.file_entry(dep_path) is not session.hash_dict[dep_path]:
+                            # Same hash but different stat (e.g. touched), so refresh stat
+                            with tgt.lock:
+                                tgt.new_hash_dict[dep_path] = session.file_entry(dep_path)
+                    else:
+                        # New file, mark as modified
+                        reason = 'new dependency {}'.format(dep_path)
+                        break
+            except:
+                pass
+
+    # Precompiled header rebuilt in this run (also checked by its hash, but not rebuilt in a dry run)
+    if not reason and tgt.pch_modified and src is not tgt.pch:
+        reason = 'changed precompiled header {}'.format(tgt.pch.obj_path)
+
+    # Check if object file exists
+    if not reason and not os.path.exists(src.obj_path):
+        reason = 'object file missing'
+
+    # Check if commands have changed since object file was built (unknown commands are recorded only)
+    if not reason and session.store.commands.get(src.obj_path, command) != command:
+        reason = 'command changed'
+
+    return reason, dependencies
+
+# Build dependency and source file, using threading
+def build_dep_and_src(tgt, src):
+    session = tgt.session
+    args = session.args
+    target = tgt.target
+    config = tgt.config
+    lock = tgt.lock
+    total = len(tgt.sources)
+
+    # Setup paths for dependency, source, and object files
+    src_path = src.src_path
+    src_name = src.name
+    iteration = src.iteration
+    dep_path = src.dep_path
+    obj_path = src.obj_path
+    if not session.dry:
+        makedir(os.path.split(dep_path)[0])
+        makedir(os.path.split(obj_path[tgt.base_offset:])[0])
+
+    # Add paths to local thread's config
+    local_config = config.copy()
+    local_config['SRC_PATH'] = src_path
+    local_config['DEP_PATH'] = dep_path
+    local_config['OBJ_PATH'] = obj_path
+
+    # Evaluated commands of object file, a changed command (e.g. different flags) needs a rebuild
+    command = '\n'.join(eval_rule(target[rule], local_config) for rule in ['DEPRULE', src.rule] if target.get(rule))
+
+    # Create dependency file if it does not exist
+    dep_created = False
+    if not os.path.exists(dep_path) and not session.dry:
+        if tgt.dep_rule:
+            command_dep = eval_rule(target['DEPRULE'], local_config)
+            run_command(session, command_dep, name=src_name, rule='DEPRULE', target=tgt.name)
+            dep_created = True
+
+    # Check if object file needs to be rebuilt
+    reason, dependencies = object_reason(tgt, src, command)
+    modified = reason is not None
+    if modified:
+        session.explain(tgt, obj_path, reason)
+        if session.dry:
+            return True
+
+    if modified:
+        # Dependency file may be stale (e.g. new includes), so regenerate it before compiling
+        if tgt.dep_rule and not dep_created:
+            run_command(session, eval_rule(target['DEPRULE'], local_config), name=src_name, rule='DEPRULE', target=tgt.name)
+            try:
+                dependencies = read_dependencies(tgt, src)
+            except:
+                dependencies = []
+
+        # Compile source file (or precompiled header)
+        if target.get(src.rule):
+            command_src = eval_rule(target[src.rule], local_config)
+
+            # Object cache key, masking output paths so that it is shared between build folders
+            cache_key = None
+            if session.object_cache:
+                cache_config = local_config.copy()
+                cache_config['DEP_PATH'] = '$DEP_PATH'
+                cache_config['OBJ_PATH'] = '$OBJ_PATH'
+                cache_command = eval_rule(target[src.rule], cache_config)
+                if dependencies:
+                    cache_key = session.object_cache.key(cache_command, dependencies[1:], session.hash_file)
+
+            if cache_key and session.object_cache.restore(cache_key, obj_path):
+                if not args.quiet:
+                    color_print('Cached {}'.format(obj_path), 'cyan')
+            else:
+                time_start = time.time()
+                success = run_command(session, command_src, iteration=iteration, total=total, name=src_name, rule=src.rule, target=tgt.name)
+                elapsed = time.time() - time_start
+                with lock:
+                    tgt.new_durations[src.rule + ' ' + obj_path] = elapsed
+                    # Source files of unity build batch get their share of its compile time (by size), used when planning batches
+                    if src.batch:
+                        sizes = [(file_stat(batch_src.src_path) or [1])[0] or 1 for batch_src in src.batch]
+                        for batch_src, size in zip(src.batch, sizes):
+                            tgt.new_durations['SRCRULE ' + batch_src.obj_path] = elapsed * size / sum(sizes)
+
+                # Dependency file generated by compiler, so refresh list of dependencies
+                if tgt.dep_in_src:
+                    try:
+                        dependencies = read_dependencies(tgt, src)
+                    except:
+                        dependencies = []
+                    cache_key = session.object_cache.key(cache_command, dependencies[1:], session.hash_file) if session.object_cache and dependencies else None
+
+                if cache_key and success and os.path.isfile(obj_path):
+                    session.object_cache.insert(cache_key, obj_path)
+
+            # Early cutoff: recompiled object file only counts as modified if its content has changed
+            session.uncache_hash(obj_path)
+            entry = session.file_entry(obj_path)
+            if entry:
+                if obj_path in session.hash_dict and stored_hash(session.hash_dict[obj_path]) == entry[3]:
+                    modified = False
+                    if args.verbose:
+                        color_print('Object file {} unchanged'.format(obj_path), 'reset')
+                with lock:
+                    tgt.new_hash_dict[obj_path] = entry
+
+        # Add dependencies' hashes to new dictionary, and hashes of unity build batch's source files (as they are included
+        # by a relative path), so that changed source files can be taken out of their batch
+        if dependencies:
+            for dep_path in dependencies[1:] + [batch_src.src_path for batch_src in src.batch]:
+                entry = session.file_entry(dep_path)
+                if entry:
+                    with lock:
+                        tgt.new_hash_dict[dep_path] = entry
+    elif dependencies:
+        # Same object file but different stat (e.g. stored while racily clean), so refresh stat for target's manifest
+        entry = session.file_entry(obj_path)
+        if entry and entry is not session.hash_dict.get(obj_path) and stored_hash(session.hash_dict.get(obj_path, entry)) == entry[3]:
+            with lock:
+                tgt.new_hash_dict[obj_path] = entry
+
+    # Record commands once object file has been built successfully
+    if session.store.commands.get(obj_path) != command:
+        with lock:
+            tgt.new_commands[obj_path] = command
+
+    src.dependencies = dependencies
+    return modified
+
+# Link target if any of its object files or additional dependencies has been modified
+def link_target(tgt):
+    session = tgt.session
+    target = tgt.target
+    config = tgt.config
+    target_path_dict = tgt.path_dict
+
+    # Add object list to target's config
+    config['OBJ_LIST'] = ' '.join([src.obj_path for src in tgt.sources])
+    config['OBJ_LIST_REL'] = ' '.join([src.obj_rel for src in tgt.sources])
 
     # Assume file is not modified unless one dependency file's hash is either missing or has changed
-    modified = False
+    reason = None
 
     # Handle additional dependencies
     if 'DEPENDS' in target:
@@ -650,86 +1574,1348 @@ for index, target in enumerate(targets):
         depends = config['DEPENDS'].split(' ')
         for dep in depends:
             try:
-                hash = sha256file(dep, '.exe')
+                hash = session.hash_file(dep, '.exe')
                 if hash == -1:
-                    hash_dict.pop(dep, None)
-                elif dep in hash_dict:
-                    if hash_dict[dep] != hash or dep in previous:
-                        modified = True
-                        new_hash_dict[dep] = hash
+                    tgt.removed_hashes.append(dep)
+                elif dep in session.hash_dict:
+                    if stored_hash(session.hash_dict[dep]) != hash or dep in session.relinked:
+                        reason = reason or 'changed dependency {}'.format(dep)
+                        tgt.new_hash_dict[dep] = session.file_entry(dep, '.exe')
+                    elif session.file_entry(dep, '.exe') is not session.hash_dict[dep]:
+                        tgt.new_hash_dict[dep] = session.file_entry(dep, '.exe')
                 else:
-                    new_hash_dict[dep] = hash
+                    tgt.new_hash_dict[dep] = session.file_entry(dep, '.exe')
             except Exception:
                 hash = ''
-                modified = True
+                reason = reason or 'changed dependency {}'.format(dep)
 
-    if target_path_dict in hash_dict:
+    if target_path_dict in session.hash_dict:
         # Check if target file has been modified by checking its SHA-256 hash against a list of known hashes
         try:
-            hash = sha256file(target_path, '.exe')
-            if hash_dict[target_path_dict] != hash:
-                modified = True
+            hash = session.hash_file(target_path_dict, '.exe')
+            if stored_hash(session.hash_dict[target_path_dict]) != hash:
+                reason = reason or ('target file changed' if hash != -1 else 'target file missing')
+            elif session.file_entry(target_path_dict, '.exe') is not session.hash_dict[target_path_dict]:
+                tgt.new_hash_dict[target_path_dict] = session.file_entry(target_path_dict, '.exe')
         except Exception:
             hash = ''
-            modified = True
+            reason = reason or 'target file changed'
     else:
-        modified = True
+        reason = reason or 'new target'
+
+    # Check if link command has changed since target was built (unknown command is recorded only)
+    command = eval_rule(target.get('OBJRULE'), config) or ''
+    if session.store.commands.get(target_path_dict) != command:
+        if target_path_dict in session.store.commands:
+            reason = reason or 'command changed'
+        tgt.new_commands[target_path_dict] = command
+    modified = reason is not None
+    if tgt.modified_any:
+        reason = reason or 'object files changed'
+    if reason:
+        session.explain(tgt, target_path_dict, reason)
+
+    # Dry run: targets depending on this target are relinked as well
+    if session.dry:
+        if reason:
+            tgt.changed = tgt.relinked = True
+        return
+
+    # Create target file
+    if modified or tgt.modified_any:
+        if 'OBJRULE' in target and target['OBJRULE']:
+            time_start = time.time()
+            run_command(session, eval_rule(target['OBJRULE'], config), rule='OBJRULE', target=tgt.name)
+            tgt.new_durations['OBJRULE ' + target_path_dict] = time.time() - time_start
+
+        # Append hash of newly generated file to list
+        try:
+            session.uncache_hash(target_path_dict)
+            entry = session.file_entry(target_path_dict, '.exe')
+            if entry:
+                # Early cutoff: targets depending on this target are only session.relinked if its content has changed
+                tgt.changed = target_path_dict not in session.hash_dict or stored_hash(session.hash_dict[target_path_dict]) != entry[3]
+                tgt.new_hash_dict[target_path_dict] = entry
+                tgt.relinked = True
+        except Exception:
+            pass
 
-    # Handle target file
-    if args.remove:
-        # Remove target file
-        remove(target_path, '.exe')
-    else:
-        # Create target file
-        if modified or modified_any:
-            if 'OBJRULE' in target and target['OBJRULE']:
-                run_command(eval_rule(target['OBJRULE'], config))
+# Run executable and post-processing rule, return execution time
+def run_target(tgt):
+    session = tgt.session
+    args = session.args
+    target = tgt.target
+    config = tgt.config
+    elapsed = datetime.timedelta()
+
+    # Run executable (repeatedly in benchmark mode), measuring wall time and peak memory of each run
+    # External commands are measured by the launcher, peak memory is None if unknown (less than that of the launcher)
+    if 'EXERULE' in target and target['EXERULE']:
+        command = os.path.join(*eval_rule(target['EXERULE'], config).split('/'))
+        runs = []
+        for iteration in range(max(1, args.repeat)):
+            job_output.runs = []
+            time_start = time.perf_counter()
+            try:
+                run_command(session, command, rule='EXERULE', target=tgt.name)
+            finally:
+                measured = job_output.runs
+                job_output.runs = None
+            peaks = [run['maxrss_mb'] for run in measured if run['maxrss_mb'] is not None]
+            runs.append({'wall': sum(run['wall'] for run in measured) if measured else time.perf_counter() - time_start,
+                'maxrss_mb': max(peaks) if peaks else None})
+        tgt.run_stats = run_statistics(command, runs)
+        job_output.memory = tgt.run_stats['maxrss_mb'] or 0
+        elapsed = datetime.timedelta(seconds=sum(run['wall'] for run in runs))
+        tgt.new_durations['EXERULE ' + tgt.path_dict] = tgt.run_stats['wall']['median']
+        if not args.quiet:
+            if len(runs) > 1:
+                wall = tgt.run_stats['wall']
+                maxrss = tgt.run_stats['maxrss_mb']
+                color_print('Execute: {} runs, min {:.6f}s, median {:.6f}s, p95 {:.6f}s, max RSS {}'.format(len(runs),
+                    wall['min'], wall['median'], wall['p95'], 'unknown' if maxrss is None else '{:.1f} MB'.format(maxrss)), 'green')
+            else:
+                color_print('Execute: {}'.format(str(elapsed)), 'green')
+
+    # Run post-processing rule
+    if 'PSTRULE' in target and target['PSTRULE']:
+        run_command(session, os.path.join(*eval_rule(target['PSTRULE'], config).split('/')), rule='PSTRULE', target=tgt.name)
+        # Post-processing may have changed any file
+        session.uncache_hash()
+
+    return elapsed
+
+# Get percentile of values (nearest rank)
+def percentile(values, percent):
+    values = sorted(values)
+    return values[max(0, math.ceil(len(values) * percent / 100) - 1)]
+
+# Get statistics of executable runs
+def run_statistics(command, runs):
+    walls = [run['wall'] for run in runs]
+    return {
+        'command':      command,
+        'runs':         runs,
+        'wall':         {'min': min(walls), 'median': statistics.median(walls), 'p95': percentile(walls, 95), 'max': max(walls)},
+        'maxrss_mb':    max([run['maxrss_mb'] for run in runs if run['maxrss_mb'] is not None], default=None)
+    }
+
+# Create targets from specifications [index, target, config], deriving target graph edges from list order,
+# DEPENDS and pre-processing rules
+def make_targets(session, target_specs):
+    tgts = [Target(session, index, target, config) for index, target, config in target_specs]
+    target_paths = {}
+    build_dir_prefix = os.path.normpath(session.build_dir) + os.sep
+    for i, tgt in enumerate(tgts):
+        earlier = tgts[:i]
+        if 'PRERULE' in tgt.target and tgt.target['PRERULE']:
+            # Pre-processing may use files generated by any previous target
+            tgt.prepare_after = earlier
+        if 'DEPENDS' in tgt.target:
+            for dep in eval_rule(tgt.target['DEPENDS'], tgt.config).split(' '):
+                dep = os.path.normpath(dep) if dep else dep
+                if dep in target_paths or dep.endswith('.exe') and dep[:-4] in target_paths:
+                    # Link after previous target that creates this dependency
+                    tgt.link_after.append(target_paths.get(dep) or target_paths[dep[:-4]])
+                elif dep.startswith(build_dir_prefix):
+                    # Unknown file in build dir, may be created by any previous target
+                    tgt.link_after.extend(earlier)
+        tgt.link_after = unique_list(tgt.link_after)
+        target_paths[os.path.normpath(tgt.path)] = tgt
+    return tgts
+
+# Get remaining critical path of each target from recorded durations, i.e. the time from starting
+# its link until all targets depending on it are done, and the next target on that path
+def target_ranks(tgts, durations):
+    successors = dict([(tgt, []) for tgt in tgts])
+    for tgt in tgts:
+        for t in tgt.link_after:
+            successors[t].append((tgt, 0))
+        for t in tgt.prepare_after:
+            successors[t].append((tgt, durations.get('COMPILE ' + tgt.path_dict, 0)))
+    ranks = {}
+    chain = {}
+    # Targets only depend on previous targets, so walk list backwards
+    for tgt in reversed(tgts):
+        tail, chain[tgt] = max([(weight + ranks[t], t) for t, weight in successors[tgt]] + [(0, None)], key=lambda x: x[0])
+        ranks[tgt] = durations.get('OBJRULE ' + tgt.path_dict, 0) + durations.get('EXERULE ' + tgt.path_dict, 0) + tail
+    return ranks, chain
+
+# Get critical path through all targets as (seconds, list of target names)
+def critical_path(tgts, durations):
+    ranks, chain = target_ranks(tgts, durations)
+    seconds, tgt = max([(durations.get('COMPILE ' + t.path_dict, 0) + ranks[t], t) for t in tgts] + [(0, None)], key=lambda x: x[0])
+    names = []
+    while tgt:
+        names.append(tgt.name)
+        tgt = chain[tgt]
+    return seconds, names
+
+# Get name of job, used as key of its recorded peak memory and of its memory hint
+def job_name(func, tgt, params):
+    if func is build_dep_and_src:
+        return params[0].rule, params[0].obj_path
+    elif func is link_target:
+        return 'OBJRULE', tgt.path_dict
+    elif func is run_target:
+        return 'EXERULE', tgt.path_dict
+    return 'PRERULE', tgt.path_dict
+
+# Get expected peak memory (MB) of job: as recorded in previous build, or as given by target's 'MEMORY' hint
+# A recorded 0 means that the job's commands did not need more memory than mimk itself
+def job_memory(func, tgt, params, memory):
+    rule, path = job_name(func, tgt, params)
+    return memory.get('{} {}'.format(rule, path)) or tgt.target.get('MEMORY', {}).get(rule, 0)
+
+# Get number of runnable processes and threads (from /proc/loadavg), or None if not available
+def runnable_processes():
+    try:
+        with open('/proc/loadavg') as f:
+            # Fourth field is runnable/total, the reading thread itself is not counted
+            return int(f.read().split()[3].split('/')[0]) - 1
+    except (OSError, IndexError, ValueError):
+        return None
+
+# Get available and total memory in MB (from /proc/meminfo), or None if not available
+def system_memory():
+    try:
+        with open('/proc/meminfo') as f:
+            info = dict(line.split(':', 1) for line in f.read().splitlines() if ':' in line)
+        return int(info['MemAvailable'].split()[0]) / 1024, int(info['MemTotal'].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        return None
+
+# System load and memory when dispatching jobs, used to throttle dispatching rather than overloading the host
+class Resources:
+    # Fraction of total memory that is kept free
+    memory_reserve = 0.05
+
+    def __init__(self, max_load):
+        self.max_load = max_load
+        self.runnable = runnable_processes() if max_load > 0 else None
+        self.memory = system_memory()
+        self.dispatched = 0
+
+    # Check whether job with expected memory may be started while running jobs are expected to use running_memory
+    # Running jobs may not have reached their peak memory yet, so their expected memory is counted in full
+    def admit(self, memory, running_memory):
+        if self.runnable is not None and self.runnable + self.dispatched >= self.max_load:
+            return False
+        if self.memory:
+            available, total = self.memory
+            if available - running_memory - memory < total * self.memory_reserve:
+                return False
+        self.dispatched += 1
+        return True
+
+# Run job in worker thread, return its result, exit status (None if successful) and peak memory of its commands
+def run_job(func, tgt, params, capture):
+    job_output.lines = [] if capture else None
+    job_output.errors = [] if capture else None
+    job_output.memory = 0
+    try:
+        return func(tgt, *params), None, job_output.memory
+    except SystemExit as e:
+        return None, e.code if isinstance(e.code, int) else 1, job_output.memory
+    except Exception as e:
+        # Failed internal command or other error: job fails like a failed command, so that the build is cancelled or continued ('-k')
+        color_print('{}: {}'.format(type(e).__name__, e))
+        return None, 1, job_output.memory
+    finally:
+        flush_output(job_output.lines, job_output.errors)
+        job_output.lines = None
+        job_output.errors = None
+
+# Build all targets as one dependency graph, so that jobs of independent targets interleave
+# Ready jobs are dispatched longest critical path first, using durations recorded in previous builds
+def build_targets(session, tgts, threads, run_unchanged=True):
+    args = session.args
+    running = {}
+    obj_waiters = {}
+    obj_results = {}
+    failed = []
+    cancelled = False
+    sequence = itertools.count()
+    # Output of concurrent jobs is captured, so that it is not interleaved
+    capture = threads > 1
+    durations = session.store.durations
+    ranks, chain = target_ranks(tgts, durations)
+
+    # Add job to target's ready queue, highest priority first
+    def queue(tgt, priority, func, params=()):
+        heapq.heappush(tgt.ready, (-priority, next(sequence), func, params))
+
+    # Mark target as failed, dropping its queued jobs; its results are not written to the build database
+    def fail(tgt, status):
+        if tgt.state != 'failed':
+            tgt.state = 'failed'
+            tgt.ready.clear()
+            failed.append((tgt, status))
+
+    # Count compiled source file, target is compiled after its last one
+    def compiled(tgt, modified):
+        if tgt.state == 'failed':
+            return
+        tgt.modified_any = tgt.modified_any or modified
+        tgt.pending -= 1
+        if tgt.pending == 0:
+            tgt.state = 'compiled'
+
+    # Executables run exclusively when benchmarking (repeated runs or results written)
+    exclusive = args.repeat > 1 or bool(args.results)
+
+    # Check whether job runs target's executable
+    def executes(tgt, func):
+        return func is run_target and bool(tgt.target.get('EXERULE'))
+
+    # Queue compiling of target's source files, object files shared between targets are only compiled once
+    def queue_sources(tgt):
+        # Source files without recorded duration are expected to take an average time
+        known = [durations['SRCRULE ' + src.obj_path] for src in tgt.sources if 'SRCRULE ' + src.obj_path in durations]
+        average = sum(known) / len(known) if known else 0
+        for src in tgt.sources:
+            if src.obj_path in obj_results:
+                compiled(tgt, obj_results[src.obj_path])
+            elif src.obj_path in obj_waiters:
+                obj_waiters[src.obj_path].append(tgt)
+            else:
+                obj_waiters[src.obj_path] = [tgt]
+                queue(tgt, durations.get('SRCRULE ' + src.obj_path, average) + ranks[tgt], build_dep_and_src, (src,))
+
+    executor = session.executor
+    changed = True
+    while True:
+        # Queue preparation and linking of targets whose predecessors are done
+        if changed:
+            changed = False
+            for tgt in tgts:
+                if tgt.state == 'waiting' and all(t.state == 'done' for t in tgt.prepare_after):
+                    tgt.state = 'preparing'
+                    queue(tgt, durations.get('COMPILE ' + tgt.path_dict, 0) + ranks[tgt], prepare_target)
+                elif tgt.state == 'compiled' and all(t.state == 'done' for t in tgt.link_after):
+                    tgt.state = 'linking'
+                    queue(tgt, ranks[tgt], link_target)
+
+        # Dispatch ready jobs, respecting targets' thread limits, limit of running executables, system load and available memory
+        # When benchmarking, executables run without any other jobs alongside them, so that their timing is not disturbed:
+        # once an executable is ready, no other jobs are dispatched until it has been started
+        # At least one job is always running, so that a build is throttled but never stalled
+        resources = Resources(args.max_load)
+        throttled = False
+        while not cancelled and len(running) < threads:
+            executables = sum(1 for tgt, func, _, _ in running.values() if executes(tgt, func))
+            candidates = [t for t in tgts if t.ready and not (t.threads and t.running >= t.threads)]
+            waiting = [t for t in candidates if executes(t, t.ready[0][2])]
+            if exclusive and waiting:
+                candidates = waiting if executables == len(running) and executables < args.run_parallel else []
+            elif exclusive and executables:
+                candidates = []
+            elif executables >= args.run_parallel:
+                candidates = [t for t in candidates if t not in waiting]
+            if not candidates:
+                break
+            tgt = min(candidates, key=lambda t: t.ready[0])
+            _, _, func, params = tgt.ready[0]
+            memory = job_memory(func, tgt, params, session.store.memory)
+            if running and not resources.admit(memory, sum(job[3] for job in running.values())):
+                throttled = True
+                break
+            heapq.heappop(tgt.ready)
+            tgt.running += 1
+            running[executor.submit(run_job, func, tgt, params, capture)] = (tgt, func, params, memory)
+        if not running:
+            break
+
+        # Handle finished jobs, checking load and memory again after a while if throttled
+        done, _ = concurrent.futures.wait(running, timeout=0.5 if throttled else None, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            tgt, func, params, _ = running.pop(future)
+            tgt.running -= 1
+            result, status, memory = future.result()
+            changed = True
+            memory_key = '{} {}'.format(*job_name(func, tgt, params))
+            if status is None and (memory or memory_key in session.store.memory):
+                with tgt.lock:
+                    tgt.new_memory[memory_key] = memory
+            if status is not None:
+                fail(tgt, status)
+                if func is build_dep_and_src and params[0] is not tgt.pch:
+                    for waiter in obj_waiters.pop(params[0].obj_path):
+                        fail(waiter, status)
+                if not args.keep_going and not cancelled:
+                    # Fail fast: stop dispatching jobs, and wait for running jobs or terminate them
+                    cancelled = True
+                    if args.kill:
+                        terminate_processes(session)
+                    if running:
+                        color_print('{} {} running jobs...'.format('Terminating' if args.kill else 'Waiting for', len(running)), 'yellow')
+                continue
+            if func is prepare_target:
+                if result is None:
+                    # Nothing to build
+                    tgt.state = 'done'
+                    continue
+                tgt.sources = result
+                if tgt.up_to_date:
+                    # Unchanged target: no per-file work, only linking checks
+                    tgt.state = 'compiled'
+                    continue
+                tgt.pending = len(result)
+                tgt.state = 'compiling' if result else 'compiled'
+                if tgt.pch:
+                    # Source files wait for precompiled header, which is on the critical path of the target
+                    queue(tgt, durations.get('PCHRULE ' + tgt.pch.obj_path, 0) + durations.get('COMPILE ' + tgt.path_dict, 0) + ranks[tgt],
+                        build_dep_and_src, (tgt.pch,))
+                else:
+                    queue_sources(tgt)
+            elif func is build_dep_and_src and params[0] is tgt.pch:
+                tgt.pch_modified = result
+                queue_sources(tgt)
+            elif func is build_dep_and_src:
+                obj_path = params[0].obj_path
+                obj_results[obj_path] = result
+                for waiter in obj_waiters.pop(obj_path):
+                    compiled(waiter, result)
+            elif func is link_target:
+                # Expected compile time of target: longest source file, or all source files spread over all threads
+                compile_times = [tgt.new_durations.get('SRCRULE ' + src.obj_path, durations.get('SRCRULE ' + src.obj_path, 0)) for src in tgt.sources]
+                if compile_times:
+                    tgt.new_durations['COMPILE ' + tgt.path_dict] = max(max(compile_times), sum(compile_times) / threads)
+
+                # Write new hashes, dependencies and durations to build database (nothing in a dry run)
+                if not session.dry:
+                    with trace('Write build database', 'phase', target=tgt.name):
+                        session.store.update(tgt.new_hash_dict, tgt.new_dep_dict, tgt.removed_hashes, tgt.new_durations, target_manifest(tgt), tgt.new_commands, tgt.new_objects,
+                            tgt.new_memory)
+                if tgt.changed:
+                    session.relinked.add(tgt.path_dict)
+                if not session.dry and (run_unchanged or tgt.relinked) and (tgt.target.get('EXERULE') or tgt.target.get('PSTRULE')):
+                    tgt.state = 'running'
+                    queue(tgt, ranks[tgt], run_target)
+                else:
+                    tgt.state = 'done'
+            elif func is run_target:
+                session.execute_elapsed += result
+                exe_key = 'EXERULE ' + tgt.path_dict
+                exe_durations = {exe_key: tgt.new_durations[exe_key]} if exe_key in tgt.new_durations else {}
+                exe_memory = {exe_key: tgt.new_memory[exe_key]} if exe_key in tgt.new_memory else {}
+                if exe_durations or exe_memory:
+                    with trace('Write build database', 'phase', target=tgt.name):
+                        session.store.update(durations=exe_durations, memory=exe_memory)
+                tgt.state = 'done'
+
+    # Report failed targets, and targets not built because the build was cancelled or they depend on a failed target
+    if failed:
+        color_print('Failed: {}'.format(' '.join(tgt.name for tgt, _ in failed)))
+        skipped = [tgt.name for tgt in tgts if tgt.state not in ['done', 'failed']]
+        if skipped:
+            color_print('Skipped: {}'.format(' '.join(skipped)), 'yellow')
+        sys.exit(failed[0][1])
+
+# Remove files of targets, one target after another
+# Dependency and object files recorded in build database (or of current source files, if none are recorded) are removed
+# in parallel batches, REMRULE and undo of PRERULE run once per target, and only the target's entries are removed from build database
+def clean_targets(session, tgts):
+    store = session.store
+
+    # Remove batch of files in worker thread
+    def remove_batch(batch):
+        for path in batch:
+            remove(session, path)
+
+    for tgt in tgts:
+        target = tgt.target
+        config = tgt.config
+        color_print('{}'.format(tgt.name), 'green', 'Target: ')
+
+        # Dependency file of each object file is at the same relative path in dependency folder
+        objects = store.target_objects(tgt.path_dict)
+        if objects:
+            files = [os.path.join(tgt.dep_dir, os.path.splitext(os.path.relpath(obj, tgt.obj_dir))[0] + '.' + config['DEPEXT']) for obj in objects] + objects
+        else:
+            sources = [Source(tgt, src_path, idx) for idx, src_path in enumerate(find_sources(tgt) or [])]
+            files = [src.dep_path for src in sources] + [src.obj_path for src in sources]
+        if target.get('PCH'):
+            pch = pch_source(tgt)
+            files += [pch.dep_path, pch.obj_path]
+        with trace('Remove files', 'phase', target=tgt.name, files=len(files)):
+            futures = [session.executor.submit(remove_batch, files[i:i + clean_batch]) for i in range(0, len(files), clean_batch)]
+            for future in futures:
+                future.result()
 
-            # Append hash of newly generated file to list
+        if 'REMRULE' in target and target['REMRULE']:
+            run_command(session, eval_rule(target['REMRULE'], config), rule='REMRULE', target=tgt.name)
+        if 'PRERULE' in target and target['PRERULE']:
+            run_command(session, os.path.join(*eval_rule(target['PRERULE'], config).split('/')), undo=True, rule='PRERULE', target=tgt.name)
+        remove(session, tgt.path, '.exe')
+        if target.get('UNITY'):
+            # Generated unity build batches, source files taken out of their batch are batched again in the next build
+            shutil.rmtree(os.path.join(session.build_dir, 'unity', tgt.name), ignore_errors=True)
+
+        with trace('Write build database', 'phase', target=tgt.name):
+            store.forget(tgt.path_dict, files + [tgt.path_dict])
+
+# Number of files removed by one job when cleaning
+clean_batch = 256
+
+# Linux inotify (via ctypes), used by watch mode
+class Inotify:
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError('inotify is not supported on this platform')
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.dirs = {}
+        self.watched = set()
+
+    # Watch directory for created, written, moved and deleted files
+    def watch(self, path):
+        if path not in self.watched and os.path.isdir(path):
+            mask = self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+            if wd >= 0:
+                self.dirs[wd] = path
+                self.watched.add(path)
+
+    # Read pending events, return list of changed paths
+    def read(self):
+        paths = []
+        while True:
             try:
-                hash = sha256file(target_path, '.exe')
-                if hash != -1:
-                    hash_dict[target_path_dict] = hash
-                    previous.append(target_path_dict)
-            except Exception:
-                pass
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return paths
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = struct.unpack_from('iIII', data, offset)
+                name = data[offset + 16:offset + 16 + length].rstrip(b'\0')
+                offset += 16 + length
+                if wd in self.dirs:
+                    paths.append(os.path.normpath(os.path.join(self.dirs[wd], os.fsdecode(name))))
+
+    def close(self):
+        os.close(self.fd)
+
+# Get files and folders to watch: source files and folders, dependencies of source files, and additional dependencies
+def watch_paths(session, tgts):
+    files = set()
+    src_dirs = set()
+    for tgt in tgts:
+        if 'SRCDIR' in tgt.target:
+            for src_dir in tgt.target['SRCDIR'].split(' '):
+                src_dirs.add(os.path.normpath(os.path.join(tgt.target.get('SRCBASE', ''), src_dir)))
+        for src in tgt.sources:
+            files.add(os.path.normpath(src.src_path))
+            if src.dep_path in session.dep_dict:
+                files.update([os.path.normpath(dep) for dep in session.dep_dict[src.dep_path][3][1:] if dep])
+        if tgt.config.get('DEPENDS'):
+            files.update([os.path.normpath(dep) for dep in tgt.config['DEPENDS'].split(' ') if dep])
+    build_dir_prefix = os.path.normpath(session.build_dir) + os.sep
+    files = set([file for file in files if not file.startswith(build_dir_prefix)])
+    return files, src_dirs
+
+# Watch mode: keep build state in memory and rebuild whenever a watched file changes
+# Return True if a configuration file has changed and mimk needs to be restarted
+def watch_targets(session, targets=None, exclude=None):
+    inotify = Inotify()
+    config_path = os.path.normpath(session.config_dir or '.')
+
+    # Local socket, so that clients ('--client') get results from this process
+    # Build folder is created (or wiped) by opening the session first
+    session.open()
+    socket_path = os.path.join(session.build_dir, '.mimk.sock')
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(8)
+
+    time_start = time.time()
+    status = session.build(targets, exclude)
+    tgts = session.tgts
+    result = {'status': status, 'relinked': [tgt.name for tgt in tgts if tgt.relinked], 'elapsed': time.time() - time_start}
+    files, src_dirs = watch_paths(session, tgts)
+
+    # Check pending events, rebuild if any watched file has changed
+    def check_events(timeout):
+        nonlocal tgts, result, files, src_dirs
+        changed = set()
+        while select.select([inotify.fd], [], [], timeout)[0]:
+            for path in inotify.read():
+                if os.path.dirname(path) == config_path and path.endswith('.py') and os.path.basename(path) != '__init__.py':
+                    return True
+                if path in files or os.path.dirname(path) in src_dirs and path.endswith('.' + session.config['SRCEXT']):
+                    changed.add(path)
+            # Wait for further events belonging to same change
+            timeout = 0.1 if changed else 0
+        if changed:
+            color_print('Changed: {}'.format(' '.join(sorted(changed))), 'yellow')
+            time_start = time.time()
+            status = session.build(targets, exclude, changed=changed, run_unchanged=False)
+            tgts = session.tgts
+            result = {'status': status, 'relinked': [tgt.name for tgt in tgts if tgt.relinked], 'elapsed': time.time() - time_start}
+            files, src_dirs = watch_paths(session, tgts)
+            color_print('{} in {:.3f}s'.format('Failed' if status else 'Rebuilt', result['elapsed']), 'red' if status else 'green')
+        return False
 
-    # Update hash dictionary with new hashes
-    hash_dict.update(new_hash_dict);
+    try:
+        watching = 0
+        while True:
+            for path in [config_path] + list(src_dirs) + [os.path.dirname(file) or '.' for file in files]:
+                inotify.watch(path)
+            if watching != id(tgts):
+                watching = id(tgts)
+                color_print('Watching {} files for changes...'.format(len(files)), 'yellow')
+            readable = select.select([inotify.fd, server], [], [])[0]
+            if check_events(0):
+                return True
+            if server in readable:
+                conn, _ = server.accept()
+                with conn:
+                    if conn.recv(64).strip() == b'build':
+                        # Make sure changes made just before request are built
+                        if check_events(0.1):
+                            return True
+                        conn.sendall(json.dumps(result).encode() + b'\n')
+    except KeyboardInterrupt:
+        return False
+    finally:
+        server.close()
+        os.remove(socket_path)
+        inotify.close()
+
+# Client mode: request build from mimk running in watch mode, return exit status
+def client_build(build_dir):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(os.path.join(build_dir, '.mimk.sock'))
+    except OSError as e:
+        color_print('Could not connect to mimk in watch mode: {}'.format(e))
+        return 1
+    with client:
+        client.sendall(b'build\n')
+        response = b''
+        for chunk in iter(lambda: client.recv(4096), b''):
+            response += chunk
+    result = json.loads(response)
+    if result['relinked']:
+        color_print('Relinked: {}'.format(' '.join(result['relinked'])), 'green')
+    color_print('{} ({:.3f}s)'.format('Failed' if result['status'] else 'Done', result['elapsed']), 'red' if result['status'] else 'green')
+    return result['status']
+
+# Get lists of target and config files, only needed for help and invalid arguments
+# Files are classified by their top-level names without importing them, unless they use 'import *'
+def scan_config_files(config_dir):
+    target_choices = []
+    config_choices = []
+    for file in sorted(os.listdir(config_dir or '.')):
+        if not file.endswith('.py') or file == '__init__.py':
+            continue
+        module_file = os.path.splitext(file)[0]
+        try:
+            with open(os.path.join(config_dir, file)) as f:
+                tree = ast.parse(f.read())
+        except (OSError, SyntaxError, ValueError):
+            continue
+        names = set()
+        for node in tree.body:
+            if isinstance(node, ast.Assign):
+                names.update(t.id for t in node.targets if isinstance(t, ast.Name))
+            elif isinstance(node, (ast.AnnAssign, ast.AugAssign)) and isinstance(node.target, ast.Name):
+                names.add(node.target.id)
+            elif isinstance(node, ast.ImportFrom):
+                names.update(alias.asname or alias.name for alias in node.names)
+        if '*' in names:
+            try:
+                module = importlib.import_module(config_dir + ('' if config_dir == '' else '.') + module_file, package=None)
+                names.update(dir(module))
+            except ImportError:
+                continue
+        if 'targets' in names:
+            target_choices.append(module_file)
+        elif 'config' in names:
+            config_choices.append(module_file)
+    return target_choices, config_choices
+
+# Get config path: sub-folder 'mimk' or 'cfg' if it exists, otherwise current working directory
+def find_config_dir():
+    return next((dir for dir in ['mimk', 'cfg'] if os.path.isdir(dir)), '')
+
+# Get normalized paths of changed files, absolute paths also relative to current working directory
+def changed_paths(files):
+    paths = set()
+    for file in files:
+        paths.add(os.path.normpath(file))
+        if os.path.isabs(file):
+            paths.add(os.path.normpath(os.path.relpath(file)))
+    return paths
+
+# Get current git commit of project, or empty string if not in a git repository
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+# Write statistics of executable runs as JSON file, for comparison across commits
+def write_results(filename, session):
+    results = {
+        'mimk':     mimk_version,
+        'build':    session.config['BUILD'],
+        'commit':   git_commit(),
+        'date':     time.strftime('%Y-%m-%d %H:%M:%S'),
+        'repeat':   max(1, session.args.repeat),
+        'targets':  session.run_results()
+    }
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=2)
+
+# Options of a build session, same as the command line options
+session_options = {
+    'arg':          None,
+    'debug':        False,
+    'executor':     'thread',
+    'explain':      False,
+    'keep_going':   False,
+    'kill':         False,
+    'max_load':     0,
+    'quiet':        False,
+    'repeat':       1,
+    'results':      None,
+    'run_parallel': 1,
+    'source':       None,
+    'threads':      0,
+    'verbose':      False,
+    'wipe':         False
+}
 
-    # Remove hash dictionary
+# Build session: holds configuration, targets, build database and caches in memory,
+# so that several builds (e.g. in watch mode, or from other Python tools) reuse them
+class Session:
+    def __init__(self, target, config=None, **options):
+        self.args = argparse.Namespace(**dict(session_options, **options))
+        self.args.target = target
+        self.args.config = config or os.environ.get('MIMK_COMPILER', 'gcc_release')
+        self.config_dir = find_config_dir()
+        self.remove = False
+        self.dry = False
+        self.store = None
+        self.hash_dict = {}
+        self.dep_dict = {}
+        self.object_cache = None
+        self.executor = None
+        self.run_start_ns = time.time_ns()
+        self.hash_cache = {}
+        self.hash_cache_lock = threading.Lock()
+        # Normalized paths of files that may have changed since the last build (None: any file)
+        self.changed_files = None
+        self.processes = set()
+        self.process_lock = threading.Lock()
+        self.cancelled = False
+        self.relinked = set()
+        self.reasons = []
+        self.reasons_lock = threading.Lock()
+        self.execute_elapsed = datetime.timedelta()
+        self.tgts = []
+        self.predicted_path = (0, [])
+        self.load()
+
+    # Import compiler and target configuration files, making config folder a package by a temporary init file
+    def load(self):
+        config_dir = self.config_dir
+
+        # Check init file and create it if it doesn't exist
+        init_file = os.path.join(config_dir, '__init__.py')
+        if not os.path.isfile(init_file):
+            open(init_file, 'a').close()
+        try:
+            self.import_files(config_dir)
+        finally:
+            # Remove init file
+            if os.path.isfile(init_file):
+                os.remove(init_file)
+
+    # Import compiler and target configuration files from config folder
+    def import_files(self, config_dir):
+        args = self.args
+
+        # Prevent *.pyc file creation
+        sys.dont_write_bytecode = True
+
+        # Set default config
+        self.config = {
+            'BUILD':    args.config,
+            'DEPPATH':  'dep',
+            'OBJPATH':  'obj',
+            'SRCEXT':   'c',
+            'INCEXT':   'h',
+            'DEPEXT':   'd',
+            'OBJEXT':   'o'
+        }
+
+        # Import config and target
+        try:
+            with trace('Import config', 'phase', config=args.config):
+                config_module = importlib.import_module(config_dir + ('' if config_dir == '' else '.') + args.config, package=None)
+            if hasattr(config_module, 'config'):
+                self.config.update(config_module.config)
+        except ImportError as e:
+            raise MimkError('Could not load config file {}.py: {}'.format(os.path.join(config_dir, args.config), e))
+        try:
+            with trace('Import target', 'phase', target=args.target):
+                self.target_module = importlib.import_module(config_dir + ('' if config_dir == '' else '.') + args.target, package=None)
+            if not hasattr(self.target_module, 'targets'):
+                raise MimkError('Target file {}.py does not define targets'.format(os.path.join(config_dir, args.target)))
+            self.targets = list(self.target_module.targets)
+            self.target_dict = {}
+            for item in dir(self.target_module):
+                if not item.startswith('__'):
+                    target_attr = getattr(self.target_module, item)
+                    if isinstance(target_attr, dict):
+                        if 'TARGET' in target_attr:
+                            self.target_dict[item] = target_attr['TARGET']
+            if hasattr(self.target_module, 'config'):
+                self.config.update(self.target_module.config)
+        except ImportError as e:
+            raise MimkError('Could not load target file {}.py: {}'.format(os.path.join(config_dir, args.target), e))
+        if not args.quiet:
+            color_print('{}'.format(self.config['BUILD']), 'cyan', 'Build:  ')
+
+        # Build dir paths
+        self.build_dir = os.path.join('build', self.config['BUILD'])
+        self.config['BUILD_DIR'] = self.build_dir
+
+    # Open build database, wiping build folder first if requested
+    # In a dry run, nothing is written: the build folder is neither wiped nor created, and the build database is opened read-only
+    def open(self):
+        args = self.args
+        if self.store:
+            return
+
+        if not self.dry:
+            # Wipe build database
+            if args.wipe and os.path.isdir(self.build_dir):
+                try:
+                    shutil.rmtree(self.build_dir)
+                except Exception:
+                    pass
+
+            # Create build directory
+            makedir(self.build_dir)
+
+        # Start executor, which is shared by all builds of session (no jobserver in a dry run, which runs no commands)
+        digest = file_digest_name(self.config)
+        executor = 'thread' if self.dry and args.executor == 'jobserver' else args.executor
+        self.executor = open_executor(executor, args.threads if args.threads > 0 else default_threads(), self.build_dir, digest)
+
+        # Open build database
+        with trace('Load build database', 'phase'):
+            self.store = open_store(self.config.get('DATABASE', 'sqlite'), self.build_dir, digest, self.dry)
+        self.hash_dict = self.store.hashes
+        self.dep_dict = self.store.deps
+
+        # Print statistics
+        if args.verbose:
+            hash_src = 0
+            hash_inc = 0
+            hash_obj = 0
+            hash_trgt = 0
+            for hash_key in self.hash_dict:
+                hash_ext = os.path.splitext(hash_key)[1][1:]
+                if hash_ext == self.config['SRCEXT']:
+                    hash_src += 1
+                elif hash_ext == self.config['INCEXT']:
+                    hash_inc += 1
+                elif hash_ext == self.config['OBJEXT']:
+                    hash_obj += 1
+                else:
+                    hash_trgt += 1
+            color_print('Loaded hash dictionary with {} entries (src: {}, inc: {}, obj: {}, trgt: {}).'.format(len(self.hash_dict), hash_src, hash_inc, hash_obj, hash_trgt), 'reset')
+
+    # Close build database and object cache
+    def close(self):
+        if self.store:
+            with trace('Close build database', 'phase'):
+                self.store.close()
+            self.store = None
+        if self.object_cache:
+            with trace('Close object cache', 'phase'):
+                self.object_cache.close()
+            self.object_cache = None
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+
+    # Get file entry, stat-ing and hashing each file only once per build
+    def file_entry(self, filename, ext=''):
+        with self.hash_cache_lock:
+            entry = self.hash_cache.setdefault(filename, {}).get(ext)
+            owner = entry is None
+            if owner:
+                # Not checked yet: this thread checks the file, other threads wait for the result
+                entry = self.hash_cache[filename][ext] = [threading.Event(), None]
+        if owner:
+            try:
+                known = self.hash_dict.get(filename)
+                if self.changed_files is not None and isinstance(known, list) and os.path.normpath(filename) not in self.changed_files:
+                    # File is known to be unchanged, so it is not even stat-ed
+                    entry[1] = known
+                else:
+                    entry[1] = stat_hash_file(filename, ext, known, self.run_start_ns, self.executor.hash)
+            finally:
+                entry[0].set()
+        else:
+            entry[0].wait()
+        return entry[1]
+
+    # Check files not checked yet in this build at once, hashing changed and unknown files as one batch (e.g. in worker processes)
+    def prehash(self, filenames):
+        files = []
+        for filename in unique_list(filenames):
+            with self.hash_cache_lock:
+                if '' in self.hash_cache.get(filename, {}):
+                    continue
+            known = self.hash_dict.get(filename)
+            if self.changed_files is not None and isinstance(known, list) and os.path.normpath(filename) not in self.changed_files:
+                # File is known to be unchanged, left to file_entry()
+                continue
+            files.append([filename, file_stat(filename), known, None])
+        with self.hash_cache_lock:
+            files = [file for file in files if '' not in self.hash_cache.setdefault(file[0], {})]
+            for file in files:
+                file[3] = self.hash_cache[file[0]][''] = [threading.Event(), None]
+        try:
+            # Missing files and files with unchanged stat need no hashing
+            cold = []
+            for file in files:
+                if file[1] and not (isinstance(file[2], list) and file[2][:3] == file[1]):
+                    cold.append(file)
+                else:
+                    file[3][1] = file[2] if file[1] else None
+            hashes = self.executor.hash_many([[filename, stat[0]] for filename, stat, _, _ in cold]) if cold else []
+            for (filename, stat, _, entry), hash in zip(cold, hashes):
+                entry[1] = stored_stat(stat, self.run_start_ns) + [hash] if hash != -1 else None
+        finally:
+            for file in files:
+                file[3][0].set()
+
+    # Get hash of file, or -1 if file does not exist
+    def hash_file(self, filename, ext=''):
+        entry = self.file_entry(filename, ext)
+        return entry[3] if entry else -1
+
+    # Remove file from hash cache (e.g. after it has been regenerated), or clear whole cache
+    def uncache_hash(self, filename=None):
+        with self.hash_cache_lock:
+            if filename is None:
+                self.hash_cache.clear()
+                self.changed_files = None
+            else:
+                self.hash_cache.pop(filename, None)
+                if self.changed_files is not None:
+                    self.changed_files.add(os.path.normpath(filename))
+
+    # Remove changed files, given as normalized paths, from hash cache
+    def uncache_paths(self, paths):
+        with self.hash_cache_lock:
+            for filename in [filename for filename in self.hash_cache if os.path.normpath(filename) in paths]:
+                del self.hash_cache[filename]
+
+    # Get targets to build and names of targets to execute (all targets if none given), also supporting variable names
+    def select_targets(self, execute=None, exclude=None):
+        targets = list(self.targets)
+        execute_list = []
+        for execute_name in execute or []:
+            if execute_name in self.target_dict:
+                execute_list.append(self.target_dict[execute_name])
+                target_attr = getattr(self.target_module, execute_name)
+                if isinstance(target_attr, dict):
+                    if 'TARGET' in target_attr:
+                        if not any(target['TARGET'] == target_attr['TARGET'] for target in targets):
+                            targets.append(target_attr)
+            else:
+                raise MimkError('Could not find target {} to execute'.format(execute_name))
+        for exclude_name in exclude or []:
+            if exclude_name in self.target_dict:
+                target_attr = getattr(self.target_module, exclude_name)
+                if isinstance(target_attr, dict):
+                    if 'TARGET' in target_attr:
+                        targets.remove(target_attr)
+            else:
+                raise MimkError('Could not find target {} to exclude'.format(exclude_name))
+            if exclude_name in execute_list:
+                execute_list.remove(exclude_name)
+        return targets, execute_list
+
+    # Set up configuration of each target, return list of [index, target, config]
+    def target_specs(self, execute=None, exclude=None):
+        args = self.args
+        targets, execute = self.select_targets(execute, exclude)
+        config = self.config.copy()
+        std_dep_path = config['DEPPATH']
+        std_obj_path = config['OBJPATH']
+        specs = []
+        for index, target in enumerate(targets):
+            # Target is changed by options, so that module's target stays unchanged for next builds
+            target = target.copy()
+
+            # If defined, target extensions override config extensions
+            if 'SRCEXT' in target:
+                config['SRCEXT'] = target['SRCEXT']
+            if 'INCEXT' in target:
+                config['INCEXT'] = target['INCEXT']
+            if 'DEPEXT' in target:
+                config['DEPEXT'] = target['DEPEXT']
+            if 'OBJEXT' in target:
+                config['OBJEXT'] = target['OBJEXT']
+            config['DEPPATH'] = target['DEPPATH'] if 'DEPPATH' in target else std_dep_path
+            config['OBJPATH'] = target['OBJPATH'] if 'OBJPATH' in target else std_obj_path
+
+            # Dep and obj sub-folders
+            dep_dir = os.path.join(self.build_dir, config['DEPPATH'])
+            obj_dir = os.path.join(self.build_dir, config['OBJPATH'])
+
+            # Create dep and obj sub-folders
+            config['DEP_DIR'] = dep_dir
+            config['OBJ_DIR'] = obj_dir
+            if not self.dry:
+                makedir(dep_dir)
+                makedir(obj_dir)
+
+            # Check target
+            if 'TARGET' not in target:
+                color_print('No target defined in section #{} of file {}.py'.format(str(index), args.target))
+                continue
+
+            # Check memory hints
+            memory = target.get('MEMORY', {})
+            if not isinstance(memory, dict) or not all(isinstance(value, (int, float)) for value in memory.values()):
+                raise MimkError("Key 'MEMORY' of target {} must be a dictionary of peak memory (MB) by rule, e.g. {{'OBJRULE': 4000}}".format(target['TARGET']))
+
+            # Arg option
+            arg = args.arg if args.arg else []
+            config['ARGS'] = ' '.join(arg)
+
+            # Copy target names (i.e., all names starting with 'TARGET') to config
+            config.update([[key, value] for key, value in target.items() if key.startswith('TARGET')])
+
+            # Execute only specific target(s)
+            if execute:
+                if target['TARGET'] not in execute:
+                    continue
+
+            # Create target path and add to current config
+            target_path = os.path.join(self.build_dir, target['TARGET'])
+            config['TARGET_PATH'] = target_path
+
+            # Precompiled header, e.g. GCC's '-include $PCH_INCLUDE' uses '$PCH_INCLUDE.gch' if it exists
+            for key in ['PCH', 'PCH_PATH', 'PCH_INCLUDE']:
+                config.pop(key, None)
+            if target.get('PCH'):
+                config['PCH'] = target['PCH']
+                config['PCH_PATH'] = os.path.join(self.build_dir, 'pch', target['TARGET'], os.path.basename(target['PCH']) + '.' + target.get('PCHEXT', config.get('PCHEXT', 'gch')))
+                config['PCH_INCLUDE'] = os.path.splitext(config['PCH_PATH'])[0]
+
+            # Source folder
+            if 'SRCBASE' in target:
+                config['SRCBASE'] = target['SRCBASE']
+            if 'SRCDIR' in target:
+                config['SRCDIR'] = target['SRCDIR']
+            if args.source:
+                target['SRCDIR'] = ' '.join(args.source)
+                config['SRCDIR'] = target['SRCDIR']
+
+            specs.append([index, target, config.copy()])
+        return specs
+
+    # Build targets (all targets if none given), return exit status
+    # Only changed files are checked again if given (e.g. by watch mode or editors), otherwise all files
+    def build(self, targets=None, exclude=None, changed=None, run_unchanged=True):
+        self.remove = False
+        self.dry = False
+        self.open()
+
+        # Open object cache
+        cache_dir = self.config.get('CACHEDIR') or os.environ.get('MIMK_CACHE_DIR')
+        if cache_dir and not self.object_cache:
+            self.object_cache = ObjectCache(cache_dir, int(self.config.get('CACHESIZE', 5120)) * 1024 * 1024, str(self.config.get('CACHESALT', '')))
+
+        return self.run(targets, exclude, changed, run_unchanged)
+
+    # Remove all dependency, object and target files and undo pre-processing rule, return exit status
+    def clean(self, targets=None, exclude=None):
+        self.remove = True
+        self.dry = False
+        self.open()
+        return self.run(targets, exclude)
+
+    # Get object files and targets that would be rebuilt and why, as list of {target, path, reason},
+    # without running any rule or writing the build database
+    # If changed files are given, they are looked up in the reverse dependency index, without checking any file
+    def dry_run(self, targets=None, exclude=None, changed=None):
+        self.remove = False
+        self.dry = True
+        # Build database opened read-only for the dry run is closed again, so that a later build opens it for writing
+        opened = not self.store
+        self.open()
+        try:
+            if changed is not None:
+                return self.affected(changed, targets, exclude)
+            self.run(targets, exclude)
+        finally:
+            self.dry = False
+            if opened:
+                self.close()
+        return self.reasons
+
+    # Get object files and targets affected by changed files from reverse dependency index, as list of {target, path, reason}
+    def affected(self, changed, targets=None, exclude=None):
+        self.open()
+        changed = changed_paths(changed)
+        objects = self.store.affected(changed)
+        # Object files may depend on other object files (precompiled headers)
+        new = set(objects)
+        while new:
+            more = self.store.affected(new)
+            new = set(more) - set(objects)
+            for obj, (target, files) in more.items():
+                objects.setdefault(obj, [target, []])[1].extend(files)
+        result = []
+        relinked = set()
+        # Targets only depend on previous targets, so walk list forwards
+        for tgt in make_targets(self, self.target_specs(targets, exclude)):
+            reason = None
+            for obj, (target, files) in sorted(objects.items()):
+                if target == tgt.path_dict:
+                    result.append({'target': tgt.name, 'path': obj, 'reason': 'changed dependency {}'.format(' '.join(sorted(files)))})
+                    reason = 'object files changed'
+            for dep in (eval_rule(tgt.target['DEPENDS'], tgt.config).split(' ') if tgt.target.get('DEPENDS') else []):
+                if not reason and (os.path.normpath(dep) in changed or os.path.normpath(dep) in relinked):
+                    reason = 'changed dependency {}'.format(dep)
+            if reason:
+                relinked.add(os.path.normpath(tgt.path_dict))
+                result.append({'target': tgt.name, 'path': tgt.path_dict, 'reason': reason})
+        return result
+
+    # Record why file of target is rebuilt, printing it if requested
+    def explain(self, tgt, path, reason):
+        with self.reasons_lock:
+            self.reasons.append({'target': tgt.name, 'path': path, 'reason': reason})
+        if self.args.explain or self.args.verbose or self.dry:
+            color_print('{}: {}'.format(path, reason), 'reset')
+
+    # Get state of targets without building them: whether target file exists and whether target is up to date
+    def status(self, targets=None, exclude=None):
+        self.remove = False
+        self.open()
+        self.uncache_hash()
+        self.run_start_ns = time.time_ns()
+        result = []
+        for tgt in make_targets(self, self.target_specs(targets, exclude)):
+            sources = find_sources(tgt)
+            if sources is not None:
+                sources = [Source(tgt, src_path, idx) for idx, src_path in enumerate(sources)]
+                if tgt.target.get('UNITY'):
+                    sources = unity_sources(tgt, sources, False)
+            result.append({
+                'target': tgt.name,
+                'path': tgt.path_dict,
+                'exists': self.file_entry(tgt.path_dict, '.exe') is not None,
+                'up_to_date': sources is not None and manifest_unchanged(tgt, sources)
+            })
+        return result
+
+    # Get statistics of executable runs of last build, by target name
+    def run_results(self):
+        return dict((tgt.name, tgt.run_stats) for tgt in self.tgts if tgt.run_stats)
+
+    # Build or remove targets, return exit status
+    def run(self, targets=None, exclude=None, changed=None, run_unchanged=True):
+        args = self.args
+        if changed is None:
+            self.uncache_hash()
+        else:
+            changed = changed_paths(changed)
+            self.uncache_paths(changed)
+            self.changed_files = changed
+        self.run_start_ns = time.time_ns()
+        self.relinked = set()
+        self.reasons = []
+        self.execute_elapsed = datetime.timedelta()
+
+        # Set number of threads
+        threads = args.threads if args.threads > 0 else default_threads()
+
+        try:
+            self.tgts = make_targets(self, self.target_specs(targets, exclude))
+            if self.remove:
+                clean_targets(self, self.tgts)
+                return 0
+            self.predicted_path = critical_path(self.tgts, self.store.durations)
+            build_targets(self, self.tgts, threads, run_unchanged)
+            return 0
+        except SystemExit as e:
+            return e.code if isinstance(e.code, int) else 1
+
+# Command line interface
+def run_cli():
+    total_time_start = datetime.datetime.now()
+    config_dir = find_config_dir()
+
+    # Default compiler
+    default_compiler = os.environ.get('MIMK_COMPILER', 'gcc_release')
+
+    # Argument parsing
+    parser = argparse.ArgumentParser(description='mimk - Minimal make')
+    target_arg = parser.add_argument('target', help='Target configuration file')
+    parser.add_argument('-a', '--arg', nargs='*', help='Add argument(s)')
+    config_arg = parser.add_argument('-c', '--config', default=default_compiler, help='Compiler configuration file')
+    parser.add_argument('-d', '--debug', action='store_true', help='Debug mode, do not stop on errors')
+    parser.add_argument('-k', '--keep-going', action='store_true', help='Keep building targets that do not depend on a failed target')
+    parser.add_argument('--kill', action='store_true', help='Terminate running commands as soon as a command fails')
+    parser.add_argument('-l', '--list', action='store_true', help='List targets')
+    parser.add_argument('-n', '--dry-run', action='store_true', help='Print which object files and targets would be rebuilt and why, without running any rule')
+    parser.add_argument('--explain', action='store_true', help='Print why each object file and target is rebuilt')
+    parser.add_argument('--changed', nargs='+', metavar='FILE', help='Only check given files for changes, all other files are assumed to be unchanged')
+    parser.add_argument('--max-load', type=float, default=0, metavar='LOAD', help='Do not start new jobs while more than LOAD processes are runnable (0: no limit)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Quiet output')
+    parser.add_argument('--run-parallel', type=int, default=1, metavar='N', help='Run at most N executables (EXERULE) concurrently (default: 1)')
+    parser.add_argument('--repeat', type=int, default=1, metavar='K', help='Run each executable K times and report min/median/p95 wall time and max RSS')
+    parser.add_argument('--results', metavar='FILE', help='Write statistics of executable runs as JSON file')
+    parser.add_argument('-r', '--remove', action='store_true', help='Remove all dependency, object and executable files and undo pre-processing rule')
+    parser.add_argument('-s', '--source', nargs='*', help='Source folder(s), overrides SRCDIR')
+    parser.add_argument('-t', '--threads', type=int, default=0, help='Number of threads (0: default, 1: turn off threading)')
+    parser.add_argument('-e', '--executor', choices=['thread', 'process', 'jobserver'], default='thread', help='Executor: thread pool, process pool for hashing and dependency parsing, or GNU make jobserver')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Verbose output')
+    parser.add_argument('-w', '--wipe', action='store_true', help='Wipe build database')
+    parser.add_argument('--watch', action='store_true', help='Watch mode, rebuild whenever a source or dependency changes (Linux only)')
+    parser.add_argument('--client', action='store_true', help='Request build from mimk running in watch mode')
+    parser.add_argument('--trace', metavar='FILE', help='Write Chrome trace-event JSON file (view in Perfetto or chrome://tracing)')
+    parser.add_argument('-x', '--execute', nargs='*', help='Execute specific target(s)')
+    parser.add_argument('-y', '--exclude', nargs='*', help='Exclude specific target(s)')
+    if any(arg in ['-h', '--help'] for arg in sys.argv[1:]):
+        target_arg.choices, config_arg.choices = scan_config_files(config_dir)
+    args = parser.parse_args()
+    if args.threads < 0:
+        parser.error('argument -t/--threads: must not be negative')
+    if args.run_parallel < 1:
+        parser.error('argument --run-parallel: must be at least 1')
+    if args.repeat < 1:
+        parser.error('argument --repeat: must be at least 1')
+
+    # Check target and config files, listing valid choices only if a file is missing
+    for arg, name, default in [[target_arg, args.target, None], [config_arg, args.config, default_compiler]]:
+        if name != default and not os.path.isfile(os.path.join(config_dir, *name.split('.')) + '.py'):
+            choices = scan_config_files(config_dir)[0 if arg is target_arg else 1]
+            parser.error('argument {}: invalid choice: {!r} (choose from {})'.format(arg.dest, name, ', '.join(repr(c) for c in choices)))
+
+    # Write trace file on exit, including failed builds
+    if args.trace:
+        start_trace(args.trace)
+
+    # Start message
+    color_print('mimk - Minimal make v{} ({})'.format(mimk_version, mimk_date), 'yellow')
+
+    session = Session(**vars(args))
+
+    # List option
+    if args.list:
+        for target in session.targets:
+            if target['TARGET']:
+                color_print('{}'.format(target['TARGET']), 'green')
+        for target in session.target_dict:
+            color_print('{}'.format(target), 'green')
+        sys.exit(0)
+
+    # Client option
+    if args.client:
+        sys.exit(client_build(session.build_dir))
+    if args.watch and args.remove:
+        color_print('Watch mode cannot be combined with removing files')
+        sys.exit(1)
+    if args.dry_run and (args.watch or args.remove or args.wipe):
+        color_print('Dry run cannot be combined with watch mode, removing files or wiping the build folder')
+        sys.exit(1)
+
+    if args.dry_run:
+        # Dry run: print files that would be rebuilt (as they are checked, or as found in reverse dependency index)
+        reasons = session.dry_run(args.execute, args.exclude, args.changed)
+        if args.changed is not None:
+            for reason in reasons:
+                color_print('{}: {}'.format(reason['path'], reason['reason']), 'reset')
+        session.close()
+        color_print('{} files would be rebuilt.'.format(len(reasons)), 'yellow')
+        sys.exit(0)
+
+    if args.watch:
+        # Watch mode: keep watching and rebuilding until interrupted, restart if configuration has changed
+        restart = watch_targets(session, args.execute, args.exclude)
+        session.close()
+        if restart:
+            color_print('Configuration changed, restarting...', 'yellow')
+            if args.trace:
+                write_trace(args.trace)
+            os.execv(sys.executable, [sys.executable] + sys.argv)
+        sys.exit(0)
+
+    # Build or remove targets
     if args.remove:
-        hash_dict = {}
-
-    # Write hash file
-    json.dump(hash_dict, open(os.path.join(build_dir, hashes_file), 'w'), indent=1, sort_keys=True)
-
-    # Run executable
-    if not args.remove:
-        if 'EXERULE' in target and target['EXERULE']:
-            time_start = datetime.datetime.now()
-            run_command(os.path.join(*eval_rule(target['EXERULE'], config).split('/')))
-            elapsed = datetime.datetime.now() - time_start
-            execute_elapsed += elapsed
-            if not args.quiet:
-                color_print('Execute: {}'.format(str(elapsed)), 'green')
+        status = session.clean(args.execute, args.exclude)
+    else:
+        status = session.build(args.execute, args.exclude, changed=args.changed)
+
+    # Close build database and object cache
+    object_cache = session.object_cache
+    durations = session.store.durations
+    session.close()
+    if status:
+        sys.exit(status)
+    if args.results and not args.remove:
+        write_results(args.results, session)
+    if object_cache:
+        if not args.quiet and object_cache.hits + object_cache.misses:
+            color_print('Object cache: {} hits, {} misses ({:2.1f}% hit rate)'.format(object_cache.hits, object_cache.misses,
+                object_cache.hits * 100 / (object_cache.hits + object_cache.misses)), 'green')
+
+    # End message
+    if not args.quiet:
+        total_elapsed = datetime.datetime.now() - total_time_start
+        # Executables running concurrently may add up to more than the total time
+        execute_elapsed = min(session.execute_elapsed, total_elapsed)
+        compile_elapsed = total_elapsed - execute_elapsed
+        compile_str = str(compile_elapsed)
+        if '.' not in compile_str:
+            compile_str += '.000000'
+        execute_str = str(execute_elapsed)
+        if '.' not in execute_str:
+            execute_str += '.000000'
+        color_print('Timings:', 'yellow')
+        color_print('Compile: {} ({:2.1f}%)'.format(compile_str, (compile_elapsed.total_seconds() * 100) / total_elapsed.total_seconds()), 'green')
+        color_print('Execute: {} ({:2.1f}%)'.format(execute_str, (execute_elapsed.total_seconds() * 100) / total_elapsed.total_seconds()), 'green')
+        color_print('Total:   {}'.format(str(total_elapsed)), 'green')
+        if any(tgt.modified_any or tgt.relinked for tgt in session.tgts):
+            actual_path = critical_path(session.tgts, durations)
+            color_print('Critical path: {} predicted, {} actual ({})'.format(str(datetime.timedelta(seconds=session.predicted_path[0])),
+                str(datetime.timedelta(seconds=actual_path[0])), ' -> '.join(actual_path[1])), 'green')
+    color_print('Done.', 'yellow')
+
+# Entry point: errors in configuration or usage end mimk with exit status 1
+def main():
+    try:
+        run_cli()
+    except MimkError as e:
+        color_print(str(e))
+        sys.exit(1)
 
-        # Run post-processing rule
-        if 'PSTRULE' in target and target['PSTRULE']:
-            run_command(os.path.join(*eval_rule(target['PSTRULE'], config).split('/')))
-
-# End message
-if not args.quiet:
-    total_elapsed = datetime.datetime.now() - total_time_start
-    compile_elapsed = total_elapsed - execute_elapsed
-    compile_str = str(compile_elapsed)
-    if '.' not in compile_str:
-        compile_str += '.000000'
-    execute_str = str(execute_elapsed)
-    if '.' not in execute_str:
-        execute_str += '.000000'
-    color_print('Timings:', 'yellow')
-    color_print('Compile: {} ({:2.1f}%)'.format(compile_str, (compile_elapsed.total_seconds() * 100) / total_elapsed.total_seconds()), 'green')
-    color_print('Execute: {} ({:2.1f}%)'.format(execute_str, (execute_elapsed.total_seconds() * 100) / total_elapsed.total_seconds()), 'green')
-    color_print('Total:   {}'.format(str(total_elapsed)), 'green')
-color_print('Done.', 'yellow')
+if __name__ == '__main__':
+    main()